@@ -1,20 +1,24 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import PyMongoError, DuplicateKeyError, BulkWriteError, OperationFailure
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, ValidationError, model_validator
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
 import jwt
 import bcrypt
 from bson import ObjectId
 import smtplib
+from email.message import EmailMessage
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
@@ -23,24 +27,304 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
 import io
 import base64
+import argparse
+import json
+import hashlib
+import hmac
+import zipfile
+from collections import OrderedDict
+from functools import lru_cache
+import asyncio
+import time
+import threading
+import multiprocessing
+import sys
+import random
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Latency histograms
+class Histogram:
+    """Cumulative latency histogram with fixed bucket bounds in seconds"""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()  # Mongo command events arrive on driver threads
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.sum += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+    def prometheus_lines(self, name: str, labels: Dict[str, str]) -> List[str]:
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        prefix = f"{label_text}," if label_text else ""
+        lines = [f'{name}_bucket{{{prefix}le="{bound}"}} {count}' for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{label_text}}} {self.sum}")
+        lines.append(f"{name}_count{{{label_text}}} {self.count}")
+        return lines
+
+# Request tracing
+# The active trace lives in a context variable; Motor copies the context
+# into its executor threads, so command listeners can attribute Mongo calls
+# to the request that issued them.
+class RequestTrace:
+    def __init__(self, sampled: bool):
+        self.sampled = sampled
+        self.mongo_commands: List[dict] = []
+        self.model_seconds = 0.0
+        self.model_count = 0
+        self.samples: Dict[str, int] = {}
+
+current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+# MongoDB command timings, per collection and operation
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._pending: Dict[tuple, tuple] = {}
+        self.histograms: Dict[tuple, Histogram] = {}
+        self.failures: Dict[tuple, int] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"
+        self._pending[(event.connection_id, event.request_id)] = (collection, event.command_name, current_trace.get())
+
+    def _finish(self, event, succeeded: bool) -> Optional[tuple]:
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return None
+        collection, command, trace = pending
+        if trace is not None:
+            trace.mongo_commands.append({
+                "collection": collection,
+                "command": command,
+                "duration_ms": event.duration_micros / 1000,
+                "ok": succeeded,
+            })
+        return collection, command
+
+    def succeeded(self, event):
+        key = self._finish(event, True)
+        if key is None:
+            return
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms.setdefault(key, Histogram())
+        histogram.observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        key = self._finish(event, False)
+        if key is not None:
+            self.failures[key] = self.failures.get(key, 0) + 1
+
+mongo_metrics = MongoCommandMetrics()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_metrics])
 db = client[os.environ['DB_NAME']]
 
 # JWT Secret (in production, use environment variable)
 JWT_SECRET = os.getenv("JWT_SECRET", "pilotage-micro-secret-2025")
 JWT_ALGORITHM = "HS256"
 
+# Shared secret for the /api/admin routes; they are refused when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Verified token cache sizing
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+# Shared user/profile cache sizing
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "30"))
+
+# Password hashing (bcrypt work factor and worker pool sizing)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # "thread" or "process"
+PASSWORD_HASH_MAX_CONCURRENCY = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", str(PASSWORD_HASH_WORKERS)))
+
+# PDF rendering worker pool
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "30"))
+PDF_RENDER_MAX_QUEUE = int(os.getenv("PDF_RENDER_MAX_QUEUE", "32"))
+
+# Background auto-reminder worker
+AUTO_REMINDERS_ENABLED = os.getenv("AUTO_REMINDERS_ENABLED", "false").lower() == "true"
+AUTO_REMINDERS_INTERVAL = float(os.getenv("AUTO_REMINDERS_INTERVAL", "3600"))
+AUTO_REMINDERS_BATCH_SIZE = int(os.getenv("AUTO_REMINDERS_BATCH_SIZE", "1000"))
+WORKER_ID = os.getenv("WORKER_ID", f"{os.uname().nodename}-{os.getpid()}")
+
+# Outbound email (SMTP_HOST unset keeps emails queued in the outbox)
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_FROM = os.getenv("SMTP_FROM", "Pilotage Micro <noreply@pilotage-micro.fr>")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "false").lower() == "true"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "30"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+
+# Notification delivery scheduler
+NOTIFICATION_SCHEDULER_ENABLED = os.getenv("NOTIFICATION_SCHEDULER_ENABLED", "false").lower() == "true"
+NOTIFICATION_POLL_INTERVAL = float(os.getenv("NOTIFICATION_POLL_INTERVAL", "30"))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "500"))
+NOTIFICATION_LEASE_SECONDS = float(os.getenv("NOTIFICATION_LEASE_SECONDS", "60"))
+
+# Read notifications are removed by a TTL index after this many days
+NOTIFICATION_READ_RETENTION_DAYS = int(os.getenv("NOTIFICATION_READ_RETENTION_DAYS", "90"))
+
+# Live event push (SSE); change streams need a replica set, otherwise events
+# are published in-process by the handlers
+LIVE_EVENTS_QUEUE_SIZE = int(os.getenv("LIVE_EVENTS_QUEUE_SIZE", "100"))
+LIVE_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("LIVE_EVENTS_HEARTBEAT_SECONDS", "15"))
+LIVE_EVENTS_CHANGE_STREAMS = os.getenv("LIVE_EVENTS_CHANGE_STREAMS", "true").lower() == "true"
+
+# Slow request profiling
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_LATENCY_BUDGET_MS = float(os.getenv("PROFILING_LATENCY_BUDGET_MS", "500"))
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.1"))
+PROFILING_SAMPLE_INTERVAL = float(os.getenv("PROFILING_SAMPLE_INTERVAL", "0.005"))
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", str(ROOT_DIR / "profiles")))
+PROFILING_MAX_REPORTS = int(os.getenv("PROFILING_MAX_REPORTS", "200"))
+
+# Recurring invoice scheduler
+RECURRING_INVOICES_ENABLED = os.getenv("RECURRING_INVOICES_ENABLED", "false").lower() == "true"
+RECURRING_INVOICES_INTERVAL = float(os.getenv("RECURRING_INVOICES_INTERVAL", "3600"))
+RECURRING_INVOICES_BATCH_SIZE = int(os.getenv("RECURRING_INVOICES_BATCH_SIZE", "1000"))
+
+# Dashboard revenue strategy: "python-sum", "aggregate" or "rollup"
+DASHBOARD_REVENUE_STRATEGY = os.getenv("DASHBOARD_REVENUE_STRATEGY", "rollup")
+
+# Rendered PDF cache ("disk" or "s3" for an S3-compatible object store)
+PDF_CACHE_BACKEND = os.getenv("PDF_CACHE_BACKEND", "disk")
+PDF_CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", str(ROOT_DIR / "pdf_cache")))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+PDF_CACHE_S3_BUCKET = os.getenv("PDF_CACHE_S3_BUCKET", "pilotage-invoices")
+PDF_CACHE_S3_ENDPOINT = os.getenv("PDF_CACHE_S3_ENDPOINT")  # e.g. a local MinIO stand-in
+
 # Create the main app
 app = FastAPI(title="Pilotage Micro API", version="1.0.0")
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
+# Password hashing service
+def _hash_password(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+def _check_password(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop on a bounded thread/process pool"""
+
+    def __init__(self, rounds: int, workers: int, executor: str, max_concurrency: int):
+        self.rounds = rounds
+        self.workers = workers
+        self.executor_kind = executor
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rehashed = 0
+        self.total_seconds = 0.0
+        self.seconds = Histogram()
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, func, *args):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            elapsed = time.perf_counter() - started
+            self.total_seconds += elapsed
+            self.seconds.observe(elapsed)
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(_hash_password, password.encode('utf-8'), self.rounds)
+        return hashed.decode('utf-8')
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_check_password, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # bcrypt hashes look like $2b$<cost>$<salt+digest>
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "rounds": self.rounds,
+            "queue_depth": self.waiting,
+            "in_flight": self.running,
+            "completed": self.completed,
+            "rehashed": self.rehashed,
+            "avg_seconds": self.total_seconds / self.completed if self.completed else 0.0,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_hasher = PasswordHasher(
+    rounds=BCRYPT_ROUNDS,
+    workers=PASSWORD_HASH_WORKERS,
+    executor=PASSWORD_HASH_EXECUTOR,
+    max_concurrency=PASSWORD_HASH_MAX_CONCURRENCY,
+)
+
 # Helper Functions
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -48,19 +332,173 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id is None:
+# Verified token cache
+# Decoded claims are memoized by token digest until the earlier of the token
+# expiry and TOKEN_CACHE_TTL, so repeated requests skip the HMAC check.
+class TokenCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self.digest(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, claims: dict):
+        expires_at = time.time() + self.ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        key = self.digest(token)
+        self._entries[key] = (claims, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # Async so the cache is only touched from the event loop thread
+    payload = token_cache.get(credentials.credentials)
+    if payload is None:
+        try:
+            payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expiré")
+        except jwt.InvalidTokenError:
             raise HTTPException(status_code=401, detail="Token invalide")
-        return user_id
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expiré")
-    except jwt.JWTError:
+        token_cache.put(credentials.credentials, payload)
+    user_id = payload.get("user_id")
+    if user_id is None:
         raise HTTPException(status_code=401, detail="Token invalide")
+    return user_id
+
+async def verify_admin(user_id: str = Depends(verify_token), x_admin_token: Optional[str] = Header(None)):
+    # Admin routes expose data across tenants: a valid user token is not enough
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Accès réservé aux administrateurs")
+    return user_id
+
+# Shared user/profile cache
+# Short-lived and per process: update_profile and create_profile invalidate
+# the local entry, and the TTL bounds staleness across workers.
+class ProfileCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[tuple]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[2] <= time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, user_id: str, user_doc: Optional[dict], profile_doc: Optional[dict]):
+        self._entries[user_id] = (user_doc, profile_doc, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+profile_cache = ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+async def load_user_and_profile(user_id: str) -> tuple:
+    """Fetch the user and their profile in one round trip, through the shared cache"""
+    cached = profile_cache.get(user_id)
+    if cached is not None:
+        return cached
+    results = await db.users.aggregate([
+        {"$match": {"id": user_id}},
+        {"$limit": 1},
+        {"$lookup": {"from": "profiles", "localField": "id", "foreignField": "user_id", "as": "profiles"}},
+    ]).to_list(1)
+    user_doc, profile_doc = None, None
+    if results:
+        user_doc = results[0]
+        profiles = user_doc.pop("profiles")
+        profile_doc = profiles[0] if profiles else None
+    # A missing profile is not cached: onboarding on another worker could not
+    # invalidate this process's entry
+    if profile_doc is not None:
+        profile_cache.put(user_id, user_doc, profile_doc)
+    return user_doc, profile_doc
+
+class RequestContext:
+    """Per-request state: the authenticated user id and lazily loaded documents"""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._user = None
+        self._profile = None
+        self._loaded = False
+
+    async def _load(self):
+        if not self._loaded:
+            self._user, self._profile = await load_user_and_profile(self.user_id)
+            self._loaded = True
+
+    async def get_profile(self) -> Optional[dict]:
+        await self._load()
+        return self._profile
+
+    async def get_user(self) -> Optional[dict]:
+        await self._load()
+        return self._user
+
+async def get_request_context(user_id: str = Depends(verify_token)) -> RequestContext:
+    return RequestContext(user_id)
 
 # Models
+class TimedModel(BaseModel):
+    """Records construction time on the active request trace"""
+
+    def __init__(self, **data):
+        trace = current_trace.get()
+        if trace is None:
+            super().__init__(**data)
+            return
+        started = time.perf_counter()
+        super().__init__(**data)
+        trace.model_seconds += time.perf_counter() - started
+        trace.model_count += 1
+
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
@@ -71,7 +509,7 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
-class User(BaseModel):
+class User(TimedModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     email: str
     first_name: str
@@ -86,8 +524,9 @@ class UserProfileCreate(BaseModel):
     micro_threshold: float = 77700.0  # Default micro-entrepreneur threshold
     vat_threshold: float = 36800.0  # Default VAT franchise threshold
     previous_year_turnover: Optional[float] = None
+    brand_color: Optional[str] = Field(None, pattern=r"^#[0-9A-Fa-f]{6}$")  # Hex accent color used on PDF invoices
 
-class UserProfile(BaseModel):
+class UserProfile(TimedModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     activity_type: str
@@ -96,6 +535,7 @@ class UserProfile(BaseModel):
     micro_threshold: float
     vat_threshold: float
     previous_year_turnover: Optional[float] = None
+    brand_color: Optional[str] = None  # Hex accent color used on PDF invoices
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -108,7 +548,7 @@ class ClientCreate(BaseModel):
     phone: Optional[str] = None
     notes: Optional[str] = None
 
-class Client(BaseModel):
+class Client(TimedModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     name: str
@@ -123,16 +563,35 @@ class Client(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 # Phase 2: Enhanced Invoice Models
+class InvoiceLine(BaseModel):
+    description: str
+    quantity: float = 1.0
+    unit_price_ht: float
+
 class InvoiceCreate(BaseModel):
     client_id: Optional[str] = None  # Link to client or manual entry
     client_name: str
     client_email: str
     client_address: str
-    amount_ht: float
+    amount_ht: Optional[float] = None  # Sum of the lines when they are given
     description: str
     due_date: Optional[datetime] = None
+    lines: List[InvoiceLine] = []
+
+    @model_validator(mode="after")
+    def check_amount_ht(self):
+        if not self.lines:
+            if self.amount_ht is None:
+                raise ValueError("Montant HT ou lignes de détail requis")
+            return self
+        lines_total = round(sum(line.quantity * line.unit_price_ht for line in self.lines), 2)
+        if self.amount_ht is None:
+            self.amount_ht = lines_total
+        elif abs(self.amount_ht - lines_total) >= 0.01:
+            raise ValueError(f"Le montant HT ({self.amount_ht:.2f}) ne correspond pas au total des lignes ({lines_total:.2f})")
+        return self
 
-class Invoice(BaseModel):
+class Invoice(TimedModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     client_id: Optional[str] = None
@@ -144,6 +603,7 @@ class Invoice(BaseModel):
     vat_amount: float = 0.0
     amount_ttc: float
     description: str
+    lines: List[InvoiceLine] = []
     status: str = "draft"  # draft, sent, paid, overdue
     created_at: datetime = Field(default_factory=datetime.utcnow)
     due_date: Optional[datetime] = None
@@ -152,13 +612,47 @@ class Invoice(BaseModel):
     reminder_count: int = 0  # Number of reminders sent
     last_reminder_date: Optional[datetime] = None
 
+# Recurring invoice templates
+RECURRING_CADENCES = {"monthly": 1, "quarterly": 3, "yearly": 12}  # Months between invoices
+
+class RecurringInvoiceCreate(BaseModel):
+    client_id: Optional[str] = None
+    client_name: str
+    client_email: str
+    client_address: str
+    amount_ht: float
+    description: str
+    lines: List[InvoiceLine] = []
+    cadence: str = Field("monthly", pattern="^(monthly|quarterly|yearly)$")
+    start_date: datetime
+    due_days: int = Field(30, ge=0, le=365)  # Payment term of generated invoices
+
+class RecurringInvoice(TimedModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    client_id: Optional[str] = None
+    client_name: str
+    client_email: str
+    client_address: str
+    amount_ht: float
+    description: str
+    lines: List[InvoiceLine] = []
+    cadence: str
+    start_date: datetime
+    due_days: int = 30
+    next_run_date: datetime
+    last_run_date: Optional[datetime] = None
+    occurrence_count: int = 0  # Invoices generated so far; run n falls on start_date + n periods
+    active: bool = True
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
 # Phase 2: Reminder System Models
 class ReminderCreate(BaseModel):
     invoice_id: str
     type: str  # "gentle", "firm", "final"
     send_date: datetime
 
-class Reminder(BaseModel):
+class Reminder(TimedModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     invoice_id: str
@@ -179,7 +673,7 @@ class MockBankTransaction(BaseModel):
     is_revenue: bool = True
     matched_invoice_id: Optional[str] = None
 
-class Obligation(BaseModel):
+class Obligation(TimedModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     type: str  # "urssaf_monthly", "urssaf_quarterly", "vat_quarterly", etc.
@@ -197,7 +691,7 @@ class NotificationCreate(BaseModel):
     schedule_date: datetime
     invoice_id: Optional[str] = None
 
-class Notification(BaseModel):
+class Notification(TimedModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     type: str
@@ -208,6 +702,211 @@ class Notification(BaseModel):
     sent_date: Optional[datetime] = None
     read_date: Optional[datetime] = None
     invoice_id: Optional[str] = None
+    key: Optional[str] = None  # "<type>:<period>:<offset>", unique per user for scheduled notifications
+
+# Database indexes
+# Declarative registry ensured at startup. create_indexes is idempotent, so
+# re-running it against an already provisioned database is a no-op.
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "profiles": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "clients": [
+        IndexModel([("user_id", ASCENDING), ("email", ASCENDING)], name="user_email_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("name", ASCENDING), ("id", ASCENDING)], name="user_name_id"),
+        IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], name="user_id_id", unique=True),
+    ],
+    "invoices": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("paid_at", ASCENDING)], name="user_status_paid_at"),
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("due_date", ASCENDING), ("reminder_count", ASCENDING)],
+            name="user_status_due_date_reminders",
+        ),
+        IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], name="user_id_id", unique=True),
+        IndexModel([("user_id", ASCENDING), ("client_id", ASCENDING)], name="user_client"),
+        IndexModel([("user_id", ASCENDING), ("invoice_number", ASCENDING)], name="user_invoice_number_unique", unique=True),
+        IndexModel([("reminder_count", ASCENDING), ("due_date", ASCENDING), ("id", ASCENDING)], name="reminder_scan"),
+    ],
+    "outbox": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+    ],
+    "reminders": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("invoice_id", ASCENDING), ("sent_date", DESCENDING)], name="user_invoice_sent_date"),
+    ],
+    "notifications": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], name="user_id_id", unique=True),
+        IndexModel([("sent_date", ASCENDING), ("scheduled_date", ASCENDING)], name="delivery_due"),
+        IndexModel(
+            [("user_id", ASCENDING), ("key", ASCENDING)],
+            name="user_key_unique",
+            unique=True,
+            partialFilterExpression={"key": {"$type": "string"}},
+        ),
+        IndexModel(
+            [("read_date", ASCENDING)],
+            name="read_ttl",
+            expireAfterSeconds=NOTIFICATION_READ_RETENTION_DAYS * 86400,
+        ),
+    ],
+    "recurring_invoices": [
+        IndexModel([("active", ASCENDING), ("next_run_date", ASCENDING), ("id", ASCENDING)], name="due_scan"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created_at"),
+        IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], name="user_id_id", unique=True),
+    ],
+    "revenue_rollups": [
+        IndexModel([("user_id", ASCENDING), ("year", ASCENDING)], name="user_year"),
+    ],
+    "obligations": [
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("due_date", ASCENDING)], name="user_status_due_date"),
+    ],
+}
+
+async def ensure_indexes(database=None) -> Dict[str, Dict[str, List[str]]]:
+    """Create every registry index, one at a time.
+    
+    A failing index (typically a unique index blocked by existing duplicates)
+    is reported under "failed" and does not prevent the others from being
+    created.
+    """
+    database = database if database is not None else db
+    created: Dict[str, List[str]] = {}
+    failed: Dict[str, List[str]] = {}
+    for collection_name, indexes in INDEX_REGISTRY.items():
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                try:
+                    await database[collection_name].create_indexes([index])
+                except OperationFailure as exc:
+                    if exc.code != 85 or "expireAfterSeconds" not in index.document:  # IndexOptionsConflict
+                        raise
+                    # A changed TTL retention is applied in place with collMod
+                    await database.command(
+                        "collMod",
+                        collection_name,
+                        index={"name": name, "expireAfterSeconds": index.document["expireAfterSeconds"]}
+                    )
+                created.setdefault(collection_name, []).append(name)
+            except PyMongoError as exc:
+                failed.setdefault(collection_name, []).append(f"{name}: {exc}")
+    return {"created": created, "failed": failed}
+
+# Representative query for each hot route, used to report query plans
+def route_queries(user_id: str) -> Dict[str, Dict[str, Any]]:
+    now = datetime.utcnow()
+    return {
+        "POST /auth/login": {"collection": "users", "filter": {"email": "user@example.com"}},
+        "GET /auth/me": {"collection": "users", "filter": {"id": user_id}},
+        "GET /profile": {"collection": "profiles", "filter": {"user_id": user_id}},
+        "POST /clients": {"collection": "clients", "filter": {"user_id": user_id, "email": "client@example.com"}},
+        "GET /clients": {"collection": "clients", "filter": {"user_id": user_id}, "sort": [("name", 1), ("id", 1)]},
+        "DELETE /clients/{id}": {"collection": "clients", "filter": {"user_id": user_id, "id": "client-id"}},
+        "GET /invoices": {"collection": "invoices", "filter": {"user_id": user_id}, "sort": [("created_at", -1), ("id", -1)]},
+        "GET /invoices/{id}/reminders": {
+            "collection": "reminders",
+            "filter": {"user_id": user_id, "invoice_id": "invoice-id"},
+            "sort": [("sent_date", -1)],
+        },
+        "GET /dashboard": {
+            "collection": "invoices",
+            "filter": {"user_id": user_id, "status": "paid", "paid_at": {"$gte": datetime(now.year, 1, 1)}},
+        },
+        "GET /dashboard (obligations)": {
+            "collection": "obligations",
+            "filter": {"user_id": user_id, "status": "pending", "due_date": {"$gte": now}},
+            "sort": [("due_date", 1)],
+        },
+        "POST /mock/auto-reminders": {
+            "collection": "invoices",
+            "filter": {
+                "user_id": user_id,
+                "status": {"$in": ["sent", "overdue"]},
+                "due_date": {"$lt": now - timedelta(days=7)},
+                "reminder_count": 0,
+            },
+        },
+        "GET /notifications": {"collection": "notifications", "filter": {"user_id": user_id}, "sort": [("created_at", -1), ("id", -1)]},
+    }
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage", "?")]
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+async def explain_route_queries(user_id: str, database=None) -> List[Dict[str, Any]]:
+    database = database if database is not None else db
+    report = []
+    for route, query in route_queries(user_id).items():
+        cursor = database[query["collection"]].find(query["filter"])
+        if query.get("sort"):
+            cursor = cursor.sort(query["sort"])
+        explanation = await cursor.explain()
+        winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(winning_plan)
+        report.append({
+            "route": route,
+            "collection": query["collection"],
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages,
+        })
+    return report
+
+# Pagination helpers
+# List endpoints use keyset pagination: the cursor is an opaque token holding
+# the sort key of the last returned document, and the next page is a range
+# scan starting right after it. The token is returned in X-Next-Cursor so the
+# response body stays a plain list.
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    payload = {k: v.isoformat() if isinstance(v, datetime) else v for k, v in values.items()}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str, sort_field: str, datetime_fields: tuple = ()) -> Dict[str, Any]:
+    """Decode a cursor holding the sort field and id of the last row seen"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        # Well-formed JSON of the wrong shape must not reach keyset_filter
+        if not isinstance(values, dict) or set(values) != {sort_field, "id"}:
+            raise ValueError("unexpected cursor fields")
+        if not isinstance(values["id"], str) or not isinstance(values[sort_field], (str, int, float)):
+            raise ValueError("unexpected cursor values")
+        for field in datetime_fields:
+            values[field] = datetime.fromisoformat(values[field])
+        return values
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+def keyset_filter(sort_field: str, direction: int, after: Dict[str, Any]) -> Dict[str, Any]:
+    op = "$gt" if direction == ASCENDING else "$lt"
+    return {"$or": [
+        {sort_field: {op: after[sort_field]}},
+        {sort_field: after[sort_field], "id": {op: after["id"]}},
+    ]}
+
+def parse_fields(fields: Optional[str], model, required: tuple) -> Optional[Dict[str, int]]:
+    """Build a Mongo projection from a comma separated field list"""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Champs inconnus : {', '.join(unknown)}")
+    projection = {"_id": 0}
+    for field in (*required, *requested):
+        projection[field] = 1
+    return projection
 
 # Health Check
 @api_router.get("/health")
@@ -216,7 +915,13 @@ async def health_check():
         "status": "ok",
         "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0.0",
-        "database": "connected"
+        "database": "connected",
+        "password_hashing": password_hasher.stats(),
+        "pdf_rendering": pdf_renderer.stats(),
+        "token_cache": token_cache.stats(),
+        "profile_cache": profile_cache.stats(),
+        "outbox": outbox_sender.stats(),
+        "live_events": live_events.stats()
     }
 
 # Authentication Routes
@@ -228,15 +933,19 @@ async def register(user_data: UserCreate):
         raise HTTPException(status_code=400, detail="Email déjà utilisé")
     
     # Hash password
-    hashed_password = bcrypt.hashpw(user_data.password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = await password_hasher.hash(user_data.password)
     
     # Create user
     user_dict = user_data.model_dump()
-    user_dict["password"] = hashed_password.decode('utf-8')
+    user_dict["password"] = hashed_password
     user_obj = User(**{k: v for k, v in user_dict.items() if k != "password"})
     user_dict["id"] = user_obj.id
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # Registered concurrently since the check above (email_unique)
+        raise HTTPException(status_code=400, detail="Email déjà utilisé")
     
     # Create access token
     token = create_access_token({"user_id": user_obj.id})
@@ -255,9 +964,16 @@ async def login(login_data: UserLogin):
         raise HTTPException(status_code=400, detail="Identifiants invalides")
     
     # Verify password
-    if not bcrypt.checkpw(login_data.password.encode('utf-8'), user_doc["password"].encode('utf-8')):
+    if not await password_hasher.verify(login_data.password, user_doc["password"]):
         raise HTTPException(status_code=400, detail="Identifiants invalides")
     
+    # Transparently upgrade the stored hash when the work factor changed
+    if password_hasher.needs_rehash(user_doc["password"]):
+        new_hash = await password_hasher.hash(login_data.password)
+        await db.users.update_one({"id": user_doc["id"]}, {"$set": {"password": new_hash}})
+        profile_cache.invalidate(user_doc["id"])
+        password_hasher.rehashed += 1
+    
     # Create user object (without password)
     user_dict = {k: v for k, v in user_doc.items() if k != "password"}
     user_obj = User(**user_dict)
@@ -272,8 +988,8 @@ async def login(login_data: UserLogin):
     }
 
 @api_router.get("/auth/me")
-async def get_current_user(user_id: str = Depends(verify_token)):
-    user_doc = await db.users.find_one({"id": user_id})
+async def get_current_user(ctx: RequestContext = Depends(get_request_context)):
+    user_doc = await ctx.get_user()
     if not user_doc:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
@@ -291,16 +1007,20 @@ async def create_profile(profile_data: UserProfileCreate, user_id: str = Depends
     profile_dict = profile_data.model_dump()
     profile_obj = UserProfile(user_id=user_id, **profile_dict)
     
-    await db.profiles.insert_one(profile_obj.model_dump())
+    try:
+        await db.profiles.insert_one(profile_obj.model_dump())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Profil déjà créé")
     
     # Update user onboarded status
     await db.users.update_one({"id": user_id}, {"$set": {"is_onboarded": True}})
+    profile_cache.invalidate(user_id)
     
     return profile_obj
 
 @api_router.get("/profile", response_model=UserProfile)
-async def get_profile(user_id: str = Depends(verify_token)):
-    profile_doc = await db.profiles.find_one({"user_id": user_id})
+async def get_profile(ctx: RequestContext = Depends(get_request_context)):
+    profile_doc = await ctx.get_profile()
     if not profile_doc:
         raise HTTPException(status_code=404, detail="Profil non trouvé")
     
@@ -316,6 +1036,7 @@ async def update_profile(profile_data: UserProfileCreate, user_id: str = Depends
         {"$set": profile_dict}
     )
     
+    profile_cache.invalidate(user_id)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Profil non trouvé")
     
@@ -333,12 +1054,31 @@ async def create_client(client_data: ClientCreate, user_id: str = Depends(verify
     client_dict = client_data.model_dump()
     client_obj = Client(user_id=user_id, **client_dict)
     
-    await db.clients.insert_one(client_obj.model_dump())
+    try:
+        await db.clients.insert_one(client_obj.model_dump())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Un client avec cet email existe déjà")
     return client_obj
 
-@api_router.get("/clients", response_model=List[Client])
-async def get_clients(user_id: str = Depends(verify_token)):
-    clients = await db.clients.find({"user_id": user_id}).sort("name", 1).to_list(100)
+@api_router.get("/clients")
+async def get_clients(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    user_id: str = Depends(verify_token)
+):
+    query: Dict[str, Any] = {"user_id": user_id}
+    if cursor:
+        query.update(keyset_filter("name", ASCENDING, decode_cursor(cursor, "name")))
+    projection = parse_fields(fields, Client, ("id", "name"))
+    
+    clients = await db.clients.find(query, projection).sort([("name", 1), ("id", 1)]).limit(limit).to_list(limit)
+    if len(clients) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"name": clients[-1]["name"], "id": clients[-1]["id"]})
+    
+    if projection:
+        return clients
     return [Client(**client) for client in clients]
 
 @api_router.get("/clients/{client_id}", response_model=Client)
@@ -367,15 +1107,402 @@ async def update_client(client_id: str, client_data: ClientCreate, user_id: str
 
 @api_router.delete("/clients/{client_id}")
 async def delete_client(client_id: str, user_id: str = Depends(verify_token)):
-    # Check if client has invoices
-    invoice_count = await db.invoices.count_documents({"user_id": user_id, "client_id": client_id})
+    # Check if client has invoices, from the maintained counter
+    client_doc = await db.clients.find_one({"id": client_id, "user_id": user_id}, {"_id": 0, "total_invoices": 1})
+    if not client_doc:
+        raise HTTPException(status_code=404, detail="Client non trouvé")
+    if await client_stats_backfilled():
+        invoice_count = client_doc.get("total_invoices", 0)
+    else:
+        # Counters of clients created before they were maintained are not trusted yet
+        invoice_count = await db.invoices.count_documents({"user_id": user_id, "client_id": client_id})
     if invoice_count > 0:
         raise HTTPException(status_code=400, detail=f"Impossible de supprimer : {invoice_count} facture(s) liée(s) à ce client")
     
-    result = await db.clients.delete_one({"id": client_id, "user_id": user_id})
+    # Guarded on the counter so an invoice linked in the meantime blocks the delete
+    result = await db.clients.delete_one({"id": client_id, "user_id": user_id, "total_invoices": {"$not": {"$gt": 0}}})
     if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Client non trouvé")
+        raise HTTPException(status_code=400, detail="Impossible de supprimer : facture(s) liée(s) à ce client")
+    
+    return {"message": "Client supprimé"}
+
+# Client statistics
+# total_invoices counts the invoices linked to a client and total_amount sums
+# the TTC amount of the paid ones. Both are kept in step with $inc on every
+# invoice write; reconcile_client_stats() recomputes them from the invoices.
+# A one-off backfill runs at startup and records a migration marker; until it
+# is set, delete_client keeps counting invoices.
+CLIENT_STATS_MIGRATION = "client_stats_backfill"
+client_stats_ready = False  # Cached once the marker has been seen
+
+async def client_stats_backfilled() -> bool:
+    global client_stats_ready
+    if not client_stats_ready:
+        client_stats_ready = await db.migrations.find_one({"_id": CLIENT_STATS_MIGRATION}) is not None
+    return client_stats_ready
+
+async def track_client_stats(transitions: List[tuple]):
+    """Apply (before, after) invoice transitions to the linked clients' counters"""
+    deltas: Dict[tuple, Dict[str, float]] = {}
+    for before, after in transitions:
+        for invoice, sign in ((before, -1), (after, 1)):
+            if not invoice or not invoice.get("client_id"):
+                continue
+            inc = deltas.setdefault((invoice["user_id"], invoice["client_id"]), {"total_invoices": 0, "total_amount": 0.0})
+            inc["total_invoices"] += sign
+            if invoice.get("status") == "paid":
+                inc["total_amount"] += sign * invoice["amount_ttc"]
+    
+    updates = [
+        UpdateOne({"user_id": user_id, "id": client_id}, {"$inc": inc})
+        for (user_id, client_id), inc in deltas.items()
+        if inc["total_invoices"] or abs(inc["total_amount"]) > 0.001
+    ]
+    if updates:
+        await db.clients.bulk_write(updates, ordered=False)
+
+async def _reconcile_client_batch(clients: List[dict]) -> int:
+    pipeline = [
+        {"$match": {
+            "user_id": {"$in": list({c["user_id"] for c in clients})},
+            "client_id": {"$in": [c["id"] for c in clients]},
+        }},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "client_id": "$client_id"},
+            "total_invoices": {"$sum": 1},
+            "total_amount": {"$sum": {"$cond": [{"$eq": ["$status", "paid"]}, "$amount_ttc", 0]}},
+        }},
+    ]
+    actual = {
+        (row["_id"]["user_id"], row["_id"]["client_id"]): row
+        async for row in db.invoices.aggregate(pipeline)
+    }
+    
+    updates = []
+    for client_doc in clients:
+        row = actual.get((client_doc["user_id"], client_doc["id"]), {})
+        total_invoices = row.get("total_invoices", 0)
+        total_amount = round(row.get("total_amount", 0.0), 2)
+        if client_doc.get("total_invoices") != total_invoices or abs(client_doc.get("total_amount", 0.0) - total_amount) > 0.001:
+            updates.append(UpdateOne(
+                {"user_id": client_doc["user_id"], "id": client_doc["id"]},
+                {"$set": {"total_invoices": total_invoices, "total_amount": total_amount}}
+            ))
+    if updates:
+        await db.clients.bulk_write(updates, ordered=False)
+    return len(updates)
+
+async def reconcile_client_stats(user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """Recompute client counters from the invoices; returns the number of clients fixed"""
+    query = {"user_id": user_id} if user_id else {}
+    projection = {"_id": 0, "id": 1, "user_id": 1, "total_invoices": 1, "total_amount": 1}
+    fixed = 0
+    batch = []
+    async for client_doc in db.clients.find(query, projection).batch_size(batch_size):
+        batch.append(client_doc)
+        if len(batch) == batch_size:
+            fixed += await _reconcile_client_batch(batch)
+            batch = []
+    if batch:
+        fixed += await _reconcile_client_batch(batch)
+    if user_id is None:
+        await db.migrations.update_one(
+            {"_id": CLIENT_STATS_MIGRATION},
+            {"$set": {"completed_at": datetime.utcnow(), "fixed": fixed}},
+            upsert=True
+        )
+    return fixed
+
+async def client_stats_backfill_loop():
+    """Reconcile every client once, in a single worker, then stop"""
+    while not await client_stats_backfilled():
+        try:
+            if await acquire_lease(CLIENT_STATS_MIGRATION, 3600):
+                fixed = await reconcile_client_stats()
+                logger.info(f"Client statistics backfill corrected {fixed} clients")
+                return
+        except Exception:
+            logger.exception("Client statistics backfill failed")
+        await asyncio.sleep(60)
+
+# Email outbox
+# Emails are persisted first and delivered by the outbox sender, which claims
+# batches under a lease, spreads them over a pool of reusable SMTP
+# connections and retries failures with exponential backoff.
+def outbox_message(message_id: str, to: str, subject: str, body: str, reminder_id: Optional[str] = None) -> dict:
+    now = datetime.utcnow()
+    return {
+        "id": message_id,
+        "to": to,
+        "subject": subject,
+        "body": body,
+        "reminder_id": reminder_id,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now,
+    }
+
+async def enqueue_emails(messages: List[dict]):
+    if not messages:
+        return
+    try:
+        await db.outbox.insert_many(messages, ordered=False)
+    except BulkWriteError as exc:
+        # Already queued by an earlier attempt
+        if any(error.get("code") != 11000 for error in exc.details.get("writeErrors", [])):
+            raise
+
+async def claim_batch(collection, query: Dict[str, Any], sort: list, limit: int, lease_seconds: float) -> List[dict]:
+    """Claim up to `limit` matching documents for this worker under a lease.
     
+    Candidates are read first, then taken with one update_many that re-checks
+    the query, so documents claimed concurrently by another worker are skipped.
+    """
+    now = datetime.utcnow()
+    claimable = {"$and": [query, {"$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]}]}
+    candidates = await collection.find(claimable, {"_id": 1}).sort(sort).limit(limit).to_list(limit)
+    if not candidates:
+        return []
+    claim_token = str(uuid.uuid4())
+    candidate_ids = [c["_id"] for c in candidates]
+    await collection.update_many(
+        {"$and": [claimable, {"_id": {"$in": candidate_ids}}]},
+        {"$set": {"lease_owner": WORKER_ID, "lease_token": claim_token, "lease_until": now + timedelta(seconds=lease_seconds)}}
+    )
+    # Read back through _id: lease_token is not indexed
+    return await collection.find({"_id": {"$in": candidate_ids}, "lease_token": claim_token}).to_list(limit)
+
+class SmtpConnectionPool:
+    """Reusable SMTP sessions; each one is used by a single thread at a time"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: List[smtplib.SMTP] = []
+        self._lock = threading.Lock()  # Guards _idle and opened; network calls run outside it
+        self.opened = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        if SMTP_STARTTLS:
+            connection.starttls()
+        if SMTP_USERNAME:
+            connection.login(SMTP_USERNAME, SMTP_PASSWORD or "")
+        with self._lock:
+            self.opened += 1
+        return connection
+
+    def _take_idle(self) -> Optional[smtplib.SMTP]:
+        with self._lock:
+            return self._idle.pop() if self._idle else None
+
+    def acquire(self) -> smtplib.SMTP:
+        while True:
+            connection = self._take_idle()
+            if connection is None:
+                return self._connect()
+            try:
+                if connection.noop()[0] == 250:
+                    return connection
+            except (smtplib.SMTPException, OSError):
+                pass
+
+    def release(self, connection: smtplib.SMTP, healthy: bool = True):
+        if healthy:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(connection)
+                    return
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def close(self):
+        connection = self._take_idle()
+        while connection is not None:
+            self.release(connection, healthy=False)
+            connection = self._take_idle()
+
+class OutboxSender:
+    def __init__(self, pool_size: int):
+        self.pool = SmtpConnectionPool(pool_size)
+        self.delivery_seconds = Histogram((1, 5, 15, 30, 60, 300, 900, 3600))
+        self.smtp_seconds = Histogram()
+        self.sent = 0
+        self.failed = 0
+
+    def _send_chunk(self, messages: List[dict]) -> List[tuple]:
+        # Runs in a worker thread: one SMTP session for the whole chunk.
+        # Each result is (message, error, smtp_seconds, permanent); permanent
+        # (5xx) refusals are not retried.
+        results = []
+        try:
+            connection = self.pool.acquire()
+        except (smtplib.SMTPException, OSError) as exc:
+            return [(message, str(exc), 0.0, False) for message in messages]
+        healthy = True
+        for message in messages:
+            email = EmailMessage()
+            email["From"] = SMTP_FROM
+            email["To"] = message["to"]
+            email["Subject"] = message["subject"]
+            email.set_content(message["body"])
+            started = time.perf_counter()
+            try:
+                connection.send_message(email)
+                results.append((message, None, time.perf_counter() - started, False))
+            except smtplib.SMTPRecipientsRefused as exc:
+                permanent = all(code >= 500 for code, _ in exc.recipients.values())
+                results.append((message, str(exc), time.perf_counter() - started, permanent))
+            except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as exc:
+                # smtplib resets the transaction, the session stays usable
+                results.append((message, str(exc), time.perf_counter() - started, exc.smtp_code >= 500))
+            except (smtplib.SMTPException, OSError) as exc:
+                # Session is unusable; fail the rest of the chunk for retry
+                healthy = False
+                failed = messages[len(results):]
+                results.extend((m, str(exc), 0.0, False) for m in failed)
+                break
+        self.pool.release(connection, healthy)
+        return results
+
+    async def send_pending(self, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+        messages = await claim_batch(
+            db.outbox,
+            {"status": "pending", "next_attempt_at": {"$lte": datetime.utcnow()}},
+            [("next_attempt_at", 1)],
+            batch_size,
+            OUTBOX_LEASE_SECONDS
+        )
+        if not messages:
+            return 0
+        
+        chunk_count = min(self.pool.size, len(messages))
+        chunks = [messages[i::chunk_count] for i in range(chunk_count)]
+        chunk_results = await asyncio.gather(*(asyncio.to_thread(self._send_chunk, chunk) for chunk in chunks))
+        
+        now = datetime.utcnow()
+        updates = []
+        delivered_reminders = []
+        for message, error, smtp_seconds, permanent in (r for results in chunk_results for r in results):
+            if error is None:
+                latency = (now - message["created_at"]).total_seconds()
+                self.delivery_seconds.observe(latency)
+                self.smtp_seconds.observe(smtp_seconds)
+                self.sent += 1
+                updates.append(UpdateOne({"_id": message["_id"]}, {
+                    "$set": {"status": "sent", "sent_at": now, "latency_seconds": latency, "lease_until": None}
+                }))
+                if message.get("reminder_id"):
+                    delivered_reminders.append(message["reminder_id"])
+            else:
+                attempts = message["attempts"] + 1
+                gave_up = permanent or attempts >= OUTBOX_MAX_ATTEMPTS
+                self.failed += gave_up
+                updates.append(UpdateOne({"_id": message["_id"]}, {"$set": {
+                    "status": "failed" if gave_up else "pending",
+                    "attempts": attempts,
+                    "last_error": error,
+                    "next_attempt_at": now + timedelta(seconds=OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)),
+                    "lease_until": None
+                }}))
+        
+        await db.outbox.bulk_write(updates, ordered=False)
+        if delivered_reminders:
+            await db.reminders.update_many({"id": {"$in": delivered_reminders}}, {"$set": {"email_sent": True}})
+        return len(messages)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool_size": self.pool.size,
+            "connections_opened": self.pool.opened,
+            "sent": self.sent,
+            "failed": self.failed,
+            "delivery_seconds": self.delivery_seconds.snapshot(),
+            "smtp_seconds": self.smtp_seconds.snapshot(),
+        }
+
+outbox_sender = OutboxSender(SMTP_POOL_SIZE)
+
+async def outbox_loop():
+    while True:
+        try:
+            # Drain full batches back to back, then wait for new mail
+            while await outbox_sender.send_pending() == OUTBOX_BATCH_SIZE:
+                pass
+        except Exception:
+            logger.exception("Outbox delivery failed")
+        await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+# Reminder engine
+# Reminder ids are derived from the invoice id and the reminder rank, so a
+# retried or resumed pass can never insert the same reminder twice, and the
+# invoice update only applies if reminder_count is still the one we planned on.
+def reminder_type_for(reminder_count: int) -> str:
+    if reminder_count >= 2:
+        return "final"
+    if reminder_count >= 1:
+        return "firm"
+    return "gentle"
+
+REMINDER_INVOICE_PROJECTION = {
+    "_id": 0, "id": 1, "user_id": 1, "invoice_number": 1, "amount_ttc": 1,
+    "status": 1, "due_date": 1, "reminder_count": 1, "client_email": 1,
+}
+
+def plan_reminder(invoice_doc: dict, now: datetime) -> tuple:
+    """Build the reminder, the matching invoice update and the outgoing email for one invoice"""
+    reminder_count = invoice_doc.get("reminder_count", 0)
+    reminder_type = reminder_type_for(reminder_count)
+    reminder = Reminder(
+        id=f"{invoice_doc['id']}-{reminder_count + 1}",
+        user_id=invoice_doc["user_id"],
+        invoice_id=invoice_doc["id"],
+        type=reminder_type,
+        subject=f"Rappel facture {invoice_doc['invoice_number']}",
+        message=f"Rappel pour la facture {invoice_doc['invoice_number']} de {invoice_doc['amount_ttc']}€",
+        sent_date=now,
+        email_sent=False,  # Set by the outbox sender once delivered
+        push_sent=True    # Mock push notification
+    )
+    email = outbox_message(
+        f"reminder-{reminder.id}", invoice_doc["client_email"], reminder.subject, reminder.message, reminder_id=reminder.id
+    )
+    
+    # Update invoice reminder count and status
+    new_status = invoice_doc["status"]
+    due_date = invoice_doc.get("due_date")
+    if due_date and (now - due_date).days > 0 and new_status != "overdue":
+        new_status = "overdue"
+    
+    update = UpdateOne(
+        {"id": invoice_doc["id"], "user_id": invoice_doc["user_id"], "reminder_count": reminder_count},
+        {"$set": {"reminder_count": reminder_count + 1, "last_reminder_date": now, "status": new_status}}
+    )
+    return reminder, update, email
+
+async def commit_reminders(plans: List[tuple]) -> Dict[str, Any]:
+    """Insert reminders and apply invoice updates in two bulk operations.
+    
+    Returns the number of invoices updated and the ids of invoices whose
+    reminder already existed (a concurrent send or a resumed pass).
+    """
+    duplicates = set()
+    if not plans:
+        return {"modified": 0, "duplicates": duplicates}
+    try:
+        await db.reminders.insert_many([reminder.model_dump() for reminder, _, _ in plans], ordered=False)
+    except BulkWriteError as exc:
+        # Duplicates come from a resumed pass; anything else is a real failure
+        for error in exc.details.get("writeErrors", []):
+            if error.get("code") != 11000:
+                raise
+            duplicates.add(plans[error["index"]][0].invoice_id)
+    await enqueue_emails([email for _, _, email in plans])
+    result = await db.invoices.bulk_write([update for _, update, _ in plans], ordered=False)
+    return {"modified": result.modified_count, "duplicates": duplicates}
+
 # Phase 2: Reminder System Routes
 @api_router.post("/invoices/{invoice_id}/reminders")
 async def send_invoice_reminder(invoice_id: str, user_id: str = Depends(verify_token)):
@@ -384,58 +1511,67 @@ async def send_invoice_reminder(invoice_id: str, user_id: str = Depends(verify_t
     if not invoice_doc:
         raise HTTPException(status_code=404, detail="Facture non trouvée")
     
-    invoice = Invoice(**invoice_doc)
-    
-    if invoice.status == "paid":
+    if invoice_doc["status"] == "paid":
         raise HTTPException(status_code=400, detail="Cette facture est déjà payée")
     
-    # Determine reminder type based on days overdue and previous reminders
-    days_overdue = 0
-    if invoice.due_date:
-        days_overdue = (datetime.utcnow() - invoice.due_date).days
-    
-    reminder_type = "gentle"
-    if invoice.reminder_count >= 1:
-        reminder_type = "firm"
-    elif invoice.reminder_count >= 2:
-        reminder_type = "final"
-    
-    # Create reminder record
-    reminder = Reminder(
-        user_id=user_id,
-        invoice_id=invoice_id,
-        type=reminder_type,
-        subject=f"Rappel facture {invoice.invoice_number}",
-        message=f"Rappel pour la facture {invoice.invoice_number} de {invoice.amount_ttc}€",
-        sent_date=datetime.utcnow(),
-        email_sent=True,  # Mock email send
-        push_sent=True    # Mock push notification
-    )
-    
-    await db.reminders.insert_one(reminder.model_dump())
-    
-    # Update invoice reminder count and status
-    new_reminder_count = invoice.reminder_count + 1
-    new_status = invoice.status
-    
-    if days_overdue > 0 and invoice.status != "overdue":
-        new_status = "overdue"
+    reminder, update, email = plan_reminder(invoice_doc, datetime.utcnow())
+    try:
+        await db.reminders.insert_one(reminder.model_dump())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Une relance est déjà en cours d'envoi pour cette facture")
+    await enqueue_emails([email])
+    await db.invoices.bulk_write([update])
     
-    await db.invoices.update_one(
-        {"id": invoice_id, "user_id": user_id},
-        {
-            "$set": {
-                "reminder_count": new_reminder_count,
-                "last_reminder_date": datetime.utcnow(),
-                "status": new_status
+    return {
+        "message": f"Relance {reminder.type} envoyée avec succès",
+        "reminder_type": reminder.type,
+        "reminder_count": invoice_doc.get("reminder_count", 0) + 1
+    }
+
+class ReminderBatchRequest(BaseModel):
+    invoice_ids: List[str] = Field(..., min_length=1, max_length=500)
+
+@api_router.post("/invoices/reminders:batch")
+async def send_invoice_reminders_batch(batch: ReminderBatchRequest, user_id: str = Depends(verify_token)):
+    invoice_ids = list(dict.fromkeys(batch.invoice_ids))
+    invoices = await db.invoices.find(
+        {"user_id": user_id, "id": {"$in": invoice_ids}},
+        REMINDER_INVOICE_PROJECTION
+    ).to_list(len(invoice_ids))
+    invoices_by_id = {invoice["id"]: invoice for invoice in invoices}
+    
+    now = datetime.utcnow()
+    results: Dict[str, Dict[str, Any]] = {}
+    plans = []
+    for invoice_id in invoice_ids:
+        invoice_doc = invoices_by_id.get(invoice_id)
+        if invoice_doc is None:
+            results[invoice_id] = {"invoice_id": invoice_id, "status": "error", "detail": "Facture non trouvée"}
+        elif invoice_doc["status"] == "paid":
+            results[invoice_id] = {"invoice_id": invoice_id, "status": "error", "detail": "Cette facture est déjà payée"}
+        else:
+            plan = plan_reminder(invoice_doc, now)
+            reminder = plan[0]
+            plans.append(plan)
+            results[invoice_id] = {
+                "invoice_id": invoice_id,
+                "status": "sent",
+                "reminder_type": reminder.type,
+                "reminder_count": invoice_doc.get("reminder_count", 0) + 1
             }
+    
+    committed = await commit_reminders(plans)
+    for invoice_id in committed["duplicates"]:
+        results[invoice_id] = {
+            "invoice_id": invoice_id,
+            "status": "error",
+            "detail": "Une relance est déjà en cours d'envoi pour cette facture"
         }
-    )
     
+    sent = sum(1 for result in results.values() if result["status"] == "sent")
     return {
-        "message": f"Relance {reminder_type} envoyée avec succès",
-        "reminder_type": reminder_type,
-        "reminder_count": new_reminder_count
+        "message": f"{sent} relance(s) envoyée(s)",
+        "results": [results[invoice_id] for invoice_id in invoice_ids]
     }
 
 @api_router.get("/invoices/{invoice_id}/reminders")
@@ -447,36 +1583,279 @@ async def get_invoice_reminders(invoice_id: str, user_id: str = Depends(verify_t
     
     return [Reminder(**reminder) for reminder in reminders]
 
+# Live events
+# Per-user subscriber queues fed either by the request handlers (single
+# process) or by a MongoDB change stream (all processes see every write).
+class EventBus:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, set] = {}
+        self.source = "local"  # "local" or "change_streams"
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def has_subscribers(self, user_id: str) -> bool:
+        return user_id in self._subscribers
+
+    def publish(self, user_id: str, event_type: str, data: Any):
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()  # Slow client: drop its oldest event
+                self.dropped += 1
+            queue.put_nowait({"type": event_type, "data": data})
+            self.published += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "subscribed_users": len(self._subscribers),
+            "connections": sum(len(q) for q in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+live_events = EventBus(LIVE_EVENTS_QUEUE_SIZE)
+
+def _should_publish(from_change_stream: bool) -> bool:
+    # With change streams active, handlers leave publishing to the watcher
+    return from_change_stream or live_events.source == "local"
+
+async def dashboard_snapshot(user_id: str) -> Optional[Dict[str, Any]]:
+    _, profile = await load_user_and_profile(user_id)
+    if not profile:
+        return None
+    revenue = await compute_revenue_summary(user_id, profile)
+    return {
+        "current_revenue": revenue["total"],
+        "monthly_revenue": revenue["months"],
+        "micro_threshold_percent": min(revenue["micro_threshold_percent"], 100),
+        "vat_threshold_percent": min(revenue["vat_threshold_percent"], 100),
+    }
+
+async def publish_invoice_status(user_id: str, invoice_id: str, invoice_status: str, from_change_stream: bool = False):
+    if not _should_publish(from_change_stream) or not live_events.has_subscribers(user_id):
+        return
+    live_events.publish(user_id, "invoice", {"id": invoice_id, "status": invoice_status})
+    snapshot = await dashboard_snapshot(user_id)
+    if snapshot:
+        live_events.publish(user_id, "dashboard", snapshot)
+
+async def publish_notifications(user_id: str, notifications: List[dict], from_change_stream: bool = False):
+    if not _should_publish(from_change_stream) or not live_events.has_subscribers(user_id):
+        return
+    for notification in notifications:
+        live_events.publish(user_id, "notification", Notification(**notification).model_dump(mode="json"))
+    live_events.publish(user_id, "unread", {"unread": await get_unread_count(user_id)})
+
+async def publish_unread_count(user_id: str, from_change_stream: bool = False):
+    if not _should_publish(from_change_stream) or not live_events.has_subscribers(user_id):
+        return
+    live_events.publish(user_id, "unread", {"unread": await get_unread_count(user_id)})
+
+async def watch_changes():
+    """Feed the event bus from a change stream when the deployment supports it"""
+    pipeline = [{"$match": {"$or": [
+        {"ns.coll": "invoices", "operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}},
+        {"ns.coll": "notifications", "operationType": "insert"},
+        {"ns.coll": "notifications", "operationType": "update", "updateDescription.updatedFields.read_date": {"$exists": True}},
+    ]}}]
+    try:
+        async with db.watch(pipeline, full_document="updateLookup") as stream:
+            live_events.source = "change_streams"
+            logger.info("Live events fed by MongoDB change streams")
+            async for change in stream:
+                document = change.get("fullDocument")
+                if not document:
+                    continue
+                if change["ns"]["coll"] == "invoices":
+                    await publish_invoice_status(document["user_id"], document["id"], document["status"], from_change_stream=True)
+                elif change["operationType"] == "insert":
+                    await publish_notifications(document["user_id"], [document], from_change_stream=True)
+                else:
+                    await publish_unread_count(document["user_id"], from_change_stream=True)
+    except OperationFailure as exc:
+        logger.info(f"Change streams unavailable ({exc.code}), publishing live events in-process")
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("Change stream watcher stopped")
+    finally:
+        live_events.source = "local"
+
+# Unread notification counters
+# One document per user; created from a count the first time it is read or
+# adjusted, then moved with $inc whenever notifications are inserted or read.
+async def init_unread_count(user_id: str) -> int:
+    """Create the counter from the notifications; keeps a counter created concurrently"""
+    unread = await db.notifications.count_documents({"user_id": user_id, "read_date": None})
+    try:
+        await db.notification_counters.update_one(
+            {"_id": user_id}, {"$setOnInsert": {"unread": unread}}, upsert=True
+        )
+    except DuplicateKeyError:
+        pass
+    counter = await db.notification_counters.find_one({"_id": user_id})
+    return counter["unread"] if counter else unread
+
+async def adjust_unread_count(user_id: str, delta: int):
+    if not delta:
+        return
+    result = await db.notification_counters.update_one({"_id": user_id}, {"$inc": {"unread": delta}})
+    if not result.matched_count:
+        # The change is already written, so the initial count includes it
+        await init_unread_count(user_id)
+
+def notification_key(notification_type: str, period: str, offset: int = 0) -> str:
+    return f"{notification_type}:{period}:{offset}"
+
+async def upsert_notifications(notifications: List[Notification]) -> int:
+    """Create keyed notifications that do not exist yet; returns how many were new"""
+    if not notifications:
+        return 0
+    result = await db.notifications.bulk_write([
+        UpdateOne(
+            {"user_id": n.user_id, "key": n.key},
+            {"$setOnInsert": n.model_dump()},
+            upsert=True
+        )
+        for n in notifications
+    ], ordered=False)
+    await adjust_unread_count(notifications[0].user_id, result.upserted_count)
+    created = [notifications[index].model_dump() for index in result.upserted_ids]
+    await publish_notifications(notifications[0].user_id, created)
+    return result.upserted_count
+
+async def get_unread_count(user_id: str) -> int:
+    counter = await db.notification_counters.find_one({"_id": user_id})
+    unread = counter["unread"] if counter else await init_unread_count(user_id)
+    if unread < 0:
+        # Drifted through a race with the initial count; recount
+        unread = await db.notifications.count_documents({"user_id": user_id, "read_date": None})
+        await db.notification_counters.update_one({"_id": user_id}, {"$set": {"unread": unread}})
+    return unread
+
 # Phase 2: Notification System Routes
 @api_router.get("/notifications")
-async def get_notifications(user_id: str = Depends(verify_token)):
-    notifications = await db.notifications.find({
-        "user_id": user_id
-    }).sort("created_at", -1).limit(20).to_list(20)
+async def get_notifications(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    user_id: str = Depends(verify_token)
+):
+    query: Dict[str, Any] = {"user_id": user_id}
+    if cursor:
+        query = {"$and": [query, keyset_filter("created_at", DESCENDING, decode_cursor(cursor, "created_at", datetime_fields=("created_at",)))]}
+    notifications = await db.notifications.find(query).sort([("created_at", -1), ("id", -1)]).limit(limit).to_list(limit)
+    if len(notifications) == limit:
+        last = notifications[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor({"created_at": last["created_at"], "id": last["id"]})
     
     return [Notification(**notification) for notification in notifications]
 
+@api_router.get("/notifications/unread-count")
+async def get_notifications_unread_count(user_id: str = Depends(verify_token)):
+    return {"unread": await get_unread_count(user_id)}
+
+class NotificationReadRequest(BaseModel):
+    ids: Optional[List[str]] = Field(None, max_length=500)
+    before: Optional[datetime] = None  # Mark everything created up to this date
+
+@api_router.post("/notifications/read")
+async def mark_notifications_read(read_request: NotificationReadRequest, user_id: str = Depends(verify_token)):
+    if not read_request.ids and read_request.before is None:
+        raise HTTPException(status_code=400, detail="Indiquez des notifications ou une date")
+    
+    query: Dict[str, Any] = {"user_id": user_id, "read_date": None}
+    if read_request.ids:
+        query["id"] = {"$in": read_request.ids}
+    if read_request.before is not None:
+        query["created_at"] = {"$lte": read_request.before}
+    
+    result = await db.notifications.update_many(query, {"$set": {"read_date": datetime.utcnow()}})
+    await adjust_unread_count(user_id, -result.modified_count)
+    await publish_unread_count(user_id)
+    
+    return {"message": f"{result.modified_count} notification(s) marquée(s) comme lue(s)", "updated": result.modified_count}
+
 @api_router.post("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, user_id: str = Depends(verify_token)):
     result = await db.notifications.update_one(
-        {"id": notification_id, "user_id": user_id},
+        {"id": notification_id, "user_id": user_id, "read_date": None},
         {"$set": {"read_date": datetime.utcnow()}}
     )
     
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Notification non trouvée")
+    if result.modified_count == 0:
+        # Either unknown or already read; only the former is an error
+        if not await db.notifications.find_one({"id": notification_id, "user_id": user_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Notification non trouvée")
+    else:
+        await adjust_unread_count(user_id, -1)
+        await publish_unread_count(user_id)
     
     return {"message": "Notification marquée comme lue"}
 
+# Notification delivery
+# Due notifications are claimed under a lease (see claim_batch), so several
+# scheduler processes can poll concurrently without double-sending.
+def dispatch_notifications(notifications: List[dict]) -> List[str]:
+    """Deliver notifications and return the ids that were sent"""
+    # Push delivery is still mocked: the mobile app shows local notifications
+    for notification in notifications:
+        logger.info(f"Notification {notification['id']} delivered to user {notification['user_id']}")
+    return [notification["id"] for notification in notifications]
+
+async def deliver_due_notifications(batch_size: int = NOTIFICATION_BATCH_SIZE) -> int:
+    notifications = await claim_batch(
+        db.notifications,
+        {"sent_date": None, "scheduled_date": {"$lte": datetime.utcnow()}},
+        [("scheduled_date", 1)],
+        batch_size,
+        NOTIFICATION_LEASE_SECONDS
+    )
+    if not notifications:
+        return 0
+    
+    delivered_ids = set(dispatch_notifications(notifications))
+    claim_token = notifications[0]["lease_token"]
+    if delivered_ids:
+        # One update through _id; notifications are only indexed on (user_id, id)
+        await db.notifications.update_many(
+            {"_id": {"$in": [n["_id"] for n in notifications if n["id"] in delivered_ids]}, "lease_token": claim_token},
+            {"$set": {"sent_date": datetime.utcnow(), "lease_until": None}}
+        )
+    return len(notifications)
+
+async def notification_scheduler_loop():
+    while True:
+        try:
+            while await deliver_due_notifications() == NOTIFICATION_BATCH_SIZE:
+                pass
+        except Exception:
+            logger.exception("Notification delivery failed")
+        await asyncio.sleep(NOTIFICATION_POLL_INTERVAL)
+
 # Phase 2: Mock notification scheduler (in real app, this would be a background task)
 @api_router.post("/mock/schedule-notifications")
-async def schedule_mock_notifications(user_id: str = Depends(verify_token)):
+async def schedule_mock_notifications(ctx: RequestContext = Depends(get_request_context)):
     # Get user profile for URSSAF periodicity
-    profile = await db.profiles.find_one({"user_id": user_id})
+    user_id = ctx.user_id
+    profile = await ctx.get_profile()
     if not profile:
         raise HTTPException(status_code=404, detail="Profil non trouvé")
     
-    notifications_created = 0
+    notifications = []
     
     # URSSAF reminders
     if profile["urssaf_periodicity"] == "monthly":
@@ -489,14 +1868,13 @@ async def schedule_mock_notifications(user_id: str = Depends(verify_token)):
             
             notification = Notification(
                 user_id=user_id,
+                key=notification_key("urssaf_reminder", next_month.strftime('%Y-%m'), days_before),
                 type="urssaf_reminder",
                 title=f"Rappel URSSAF - J{-days_before if days_before > 0 else ''}",
                 message=f"N'oubliez pas votre déclaration URSSAF mensuelle (échéance: {next_month.strftime('%d/%m/%Y')})",
                 scheduled_date=notification_date
             )
-            
-            await db.notifications.insert_one(notification.model_dump())
-            notifications_created += 1
+            notifications.append(notification)
     
     # VAT threshold alert (mock)
     current_revenue = 15000  # Mock current revenue
@@ -506,80 +1884,195 @@ async def schedule_mock_notifications(user_id: str = Depends(verify_token)):
     if threshold_percent > 70:
         notification = Notification(
             user_id=user_id,
+            key=notification_key("vat_alert", datetime.utcnow().strftime('%Y-%m')),
             type="vat_alert",
             title="Alerte seuil TVA",
             message=f"Attention: vous avez atteint {threshold_percent:.1f}% du seuil de franchise TVA",
             scheduled_date=datetime.utcnow()
         )
-        
-        await db.notifications.insert_one(notification.model_dump())
-        notifications_created += 1
+        notifications.append(notification)
+    
+    # Re-scheduling the same period only creates what is missing
+    notifications_created = await upsert_notifications(notifications)
     
     return {"message": f"{notifications_created} notifications programmées"}
 
-# Phase 2: Auto-reminder system (mock - would be a background job)
-@api_router.post("/mock/auto-reminders")
-async def process_auto_reminders(user_id: str = Depends(verify_token)):
-    # Find overdue invoices that need reminders
-    overdue_date_j7 = datetime.utcnow() - timedelta(days=7)
-    overdue_date_j14 = datetime.utcnow() - timedelta(days=14)
-    
-    invoices_j7 = await db.invoices.find({
-        "user_id": user_id,
-        "status": {"$in": ["sent", "overdue"]},
-        "due_date": {"$lt": overdue_date_j7},
-        "reminder_count": 0
-    }).to_list(10)
+# Phase 2: Auto-reminder system
+# J+7 gentle reminders for unreminded sent/overdue invoices, J+14 firm
+# reminders for overdue invoices reminded once
+AUTO_REMINDER_COHORTS = [
+    ("j7", 7, {"reminder_count": 0, "status": {"$in": ["sent", "overdue"]}}),
+    ("j14", 14, {"reminder_count": 1, "status": "overdue"}),
+]
+
+async def acquire_lease(name: str, seconds: float) -> bool:
+    """Claim a named lease so only one process runs a periodic job at a time"""
+    now = datetime.utcnow()
+    try:
+        lease = await db.worker_leases.find_one_and_update(
+            {"_id": name, "$or": [{"lease_until": {"$lt": now}}, {"owner": WORKER_ID}]},
+            {"$set": {"owner": WORKER_ID, "lease_until": now + timedelta(seconds=seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return False  # Held by another worker
+    return lease is not None and lease["owner"] == WORKER_ID
+
+async def run_auto_reminders(user_id: Optional[str] = None, batch_size: int = AUTO_REMINDERS_BATCH_SIZE) -> int:
+    """Send due automatic reminders, across all users unless user_id is given.
     
-    invoices_j14 = await db.invoices.find({
-        "user_id": user_id,
-        "status": "overdue",
-        "due_date": {"$lt": overdue_date_j14},
-        "reminder_count": 1
-    }).to_list(10)
+    Invoices are scanned in (due_date, id) order through the reminder_scan
+    index. Tenant-wide passes checkpoint the last key of each cohort, so a
+    restarted pass resumes with the same cutoff where the previous one stopped.
+    """
+    checkpoint = None
+    positions: Dict[str, Any] = {}
+    now = datetime.utcnow()
+    if user_id is None:
+        checkpoint = await db.worker_checkpoints.find_one({"_id": "auto_reminders"})
+        if checkpoint and not checkpoint.get("finished"):
+            now = checkpoint["run_started_at"]
+            positions = checkpoint.get("positions", {})
+        else:
+            await db.worker_checkpoints.replace_one(
+                {"_id": "auto_reminders"},
+                {"run_started_at": now, "positions": {}, "processed": 0, "finished": False},
+                upsert=True
+            )
     
     reminders_sent = 0
-    
-    # Send J+7 gentle reminders
-    for invoice_doc in invoices_j7:
-        await send_invoice_reminder(invoice_doc["id"], user_id)
-        reminders_sent += 1
-    
-    # Send J+14 firm reminders
-    for invoice_doc in invoices_j14:
-        await send_invoice_reminder(invoice_doc["id"], user_id)
-        reminders_sent += 1
-    
+    for cohort, days, cohort_filter in AUTO_REMINDER_COHORTS:
+        # Cohorts run one after another: an invoice reminded earlier in this
+        # run must not move straight on to the next cohort
+        base_query = {
+            **cohort_filter,
+            "due_date": {"$lt": now - timedelta(days=days)},
+            "last_reminder_date": {"$not": {"$gte": now}},
+        }
+        if user_id:
+            base_query["user_id"] = user_id
+        
+        while True:
+            query = base_query
+            after = positions.get(cohort)
+            if after:
+                query = {"$and": [base_query, keyset_filter("due_date", ASCENDING, after)]}
+            invoices = await db.invoices.find(query, REMINDER_INVOICE_PROJECTION).sort([("due_date", 1), ("id", 1)]).limit(batch_size).to_list(batch_size)
+            if not invoices:
+                break
+            
+            committed = await commit_reminders([plan_reminder(doc, now) for doc in invoices])
+            reminders_sent += committed["modified"]
+            positions[cohort] = {"due_date": invoices[-1]["due_date"], "id": invoices[-1]["id"]}
+            if user_id is None:
+                await db.worker_checkpoints.update_one(
+                    {"_id": "auto_reminders"},
+                    {"$set": {f"positions.{cohort}": positions[cohort]}, "$inc": {"processed": len(invoices)}}
+                )
+            if len(invoices) < batch_size:
+                break
+    
+    if user_id is None:
+        await db.worker_checkpoints.update_one(
+            {"_id": "auto_reminders"},
+            {"$set": {"finished": True, "finished_at": datetime.utcnow()}}
+        )
+    return reminders_sent
+
+async def auto_reminder_loop():
+    while True:
+        try:
+            if await acquire_lease("auto_reminders", AUTO_REMINDERS_INTERVAL):
+                reminders_sent = await run_auto_reminders()
+                logger.info(f"Auto-reminder pass sent {reminders_sent} reminders")
+        except Exception:
+            logger.exception("Auto-reminder pass failed")
+        await asyncio.sleep(AUTO_REMINDERS_INTERVAL)
+
+@api_router.post("/mock/auto-reminders")
+async def process_auto_reminders(user_id: str = Depends(verify_token)):
+    reminders_sent = await run_auto_reminders(user_id=user_id)
     return {"message": f"{reminders_sent} relances automatiques envoyées"}
 
 # Phase 2: PDF Generation
-def generate_invoice_pdf(invoice: Invoice, user_profile: dict, user_info: dict) -> bytes:
+# Styles are built once per process and per branding variant, then shared by
+# every render; ReportLab only reads them while laying out a document.
+DEFAULT_BRAND_COLOR = '#007AFF'
+
+class InvoiceTemplate:
+    """Precompiled paragraph and table styles for one branding variant"""
+
+    def __init__(self, brand_color: str = DEFAULT_BRAND_COLOR):
+        self.styles = getSampleStyleSheet()
+        self.normal_style = self.styles['Normal']
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=self.styles['Heading1'],
+            fontSize=16,
+            spaceAfter=30,
+            textColor=colors.HexColor(brand_color)
+        )
+        self.header_style = ParagraphStyle(
+            'HeaderStyle',
+            parent=self.styles['Normal'],
+            fontSize=10,
+            spaceAfter=12
+        )
+        self.cell_style = ParagraphStyle(
+            'CellStyle',
+            parent=self.styles['Normal'],
+            fontSize=10,
+            alignment=1
+        )
+        self.col_widths = [8*cm, 3*cm, 2*cm, 3*cm]
+        self.table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(brand_color)),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ])
+
+@lru_cache(maxsize=32)
+def get_invoice_template(brand_color: Optional[str] = None) -> InvoiceTemplate:
+    return InvoiceTemplate(brand_color or DEFAULT_BRAND_COLOR)
+
+def _invoice_table_rows(invoice: Invoice, template: InvoiceTemplate) -> List[list]:
+    rows = [['Description', 'Montant HT', 'TVA', 'Montant TTC']]
+    if not invoice.lines:
+        rows.append([invoice.description, f"{invoice.amount_ht:.2f} €", f"{invoice.vat_amount:.2f} €", f"{invoice.amount_ttc:.2f} €"])
+        return rows
+    
+    # One row per line (wrapped descriptions), then the invoice totals
+    vat_rate = invoice.vat_amount / invoice.amount_ht if invoice.amount_ht else 0.0
+    for line in invoice.lines:
+        line_ht = line.quantity * line.unit_price_ht
+        line_vat = line_ht * vat_rate
+        description = line.description if line.quantity == 1 else f"{line.description} (x{line.quantity:g})"
+        rows.append([
+            Paragraph(description, template.cell_style),
+            f"{line_ht:.2f} €",
+            f"{line_vat:.2f} €",
+            f"{line_ht + line_vat:.2f} €"
+        ])
+    rows.append(['Total', f"{invoice.amount_ht:.2f} €", f"{invoice.vat_amount:.2f} €", f"{invoice.amount_ttc:.2f} €"])
+    return rows
+
+def generate_invoice_pdf(invoice: Invoice, user_profile: dict, user_info: dict, template: Optional[InvoiceTemplate] = None) -> bytes:
     """Generate PDF for invoice with French legal mentions"""
+    template = template or get_invoice_template(user_profile.get('brand_color'))
     buffer = io.BytesIO()
     
     # Create PDF document
     doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
     story = []
     
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        textColor=colors.HexColor('#007AFF')
-    )
-    
-    header_style = ParagraphStyle(
-        'HeaderStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=12
-    )
-    
     # Invoice header
-    story.append(Paragraph(f"FACTURE {invoice.invoice_number}", title_style))
+    story.append(Paragraph(f"FACTURE {invoice.invoice_number}", template.title_style))
     story.append(Spacer(1, 12))
     
     # User info (prestaire)
@@ -589,7 +2082,7 @@ def generate_invoice_pdf(invoice: Invoice, user_profile: dict, user_info: dict)
     Email: {user_info['email']}<br/>
     Activité: {user_profile['activity_type']}
     """
-    story.append(Paragraph(user_info_text, header_style))
+    story.append(Paragraph(user_info_text, template.header_style))
     story.append(Spacer(1, 20))
     
     # Client info
@@ -599,26 +2092,12 @@ def generate_invoice_pdf(invoice: Invoice, user_profile: dict, user_info: dict)
     {invoice.client_address}<br/>
     Email: {invoice.client_email}
     """
-    story.append(Paragraph(client_info_text, header_style))
+    story.append(Paragraph(client_info_text, template.header_style))
     story.append(Spacer(1, 20))
     
-    # Invoice details table
-    data = [
-        ['Description', 'Montant HT', 'TVA', 'Montant TTC'],
-        [invoice.description, f"{invoice.amount_ht:.2f} €", f"{invoice.vat_amount:.2f} €", f"{invoice.amount_ttc:.2f} €"]
-    ]
-    
-    table = Table(data, colWidths=[8*cm, 3*cm, 2*cm, 3*cm])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#007AFF')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    # Invoice details table; long tables split across pages with the header repeated
+    table = Table(_invoice_table_rows(invoice, template), colWidths=template.col_widths, repeatRows=1)
+    table.setStyle(template.table_style)
     
     story.append(table)
     story.append(Spacer(1, 30))
@@ -629,88 +2108,947 @@ def generate_invoice_pdf(invoice: Invoice, user_profile: dict, user_info: dict)
     else:
         legal_text = f"TVA applicable - Régime: {user_profile.get('vat_regime', 'Standard')}"
     
-    story.append(Paragraph(f"<i>{legal_text}</i>", styles['Normal']))
+    story.append(Paragraph(f"<i>{legal_text}</i>", template.normal_style))
     story.append(Spacer(1, 10))
     
     # Payment info
     if invoice.due_date:
         due_text = f"Date d'échéance: {invoice.due_date.strftime('%d/%m/%Y')}"
-        story.append(Paragraph(due_text, styles['Normal']))
+        story.append(Paragraph(due_text, template.normal_style))
     
     story.append(Spacer(1, 20))
-    story.append(Paragraph(f"Facture créée le {invoice.created_at.strftime('%d/%m/%Y')}", header_style))
+    story.append(Paragraph(f"Facture créée le {invoice.created_at.strftime('%d/%m/%Y')}", template.header_style))
     
     # Build PDF
     doc.build(story)
     buffer.seek(0)
     return buffer.getvalue()
 
+# Rendered PDF cache
+# PDFs are stored under a hash of every field that ends up in the document,
+# so any change to the invoice, profile or user produces a new key and stale
+# entries simply age out of the LRU.
+PDF_TEMPLATE_VERSION = "2"
+PDF_INVOICE_FIELDS = (
+    "invoice_number", "client_name", "client_email", "client_address", "description",
+    "amount_ht", "vat_amount", "amount_ttc", "due_date", "created_at", "lines",
+)
+PDF_PROFILE_FIELDS = ("activity_type", "vat_regime", "brand_color")
+PDF_USER_FIELDS = ("first_name", "last_name", "email")
+
+def pdf_cache_key(invoice: Invoice, user_profile: dict, user_info: dict) -> str:
+    invoice_dict = invoice.model_dump()
+    content = {
+        "template": PDF_TEMPLATE_VERSION,
+        "invoice": {f: invoice_dict.get(f) for f in PDF_INVOICE_FIELDS},
+        "profile": {f: user_profile.get(f) for f in PDF_PROFILE_FIELDS},
+        "user": {f: user_info.get(f) for f in PDF_USER_FIELDS},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+class DiskPdfStore:
+    """Local PDF store with size-bounded LRU eviction"""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # key -> size, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        for path in sorted(self.directory.glob("*.pdf"), key=lambda p: p.stat().st_mtime):
+            self._entries[path.stem] = path.stat().st_size
+        self.total_bytes = sum(self._entries.values())
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pdf"
+
+    def location(self, key: str) -> str:
+        return str(self._path(key))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if key not in self._entries:
+            return None
+        try:
+            data = await asyncio.to_thread(self._path(key).read_bytes)
+        except FileNotFoundError:
+            self.total_bytes -= self._entries.pop(key, 0)
+            return None
+        self._entries.move_to_end(key)
+        os.utime(self._path(key))
+        return data
+
+    def _write(self, key: str, data: bytes):
+        # Created on first write, so importing the app never touches the disk
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._path(key).write_bytes(data)
+
+    async def put(self, key: str, data: bytes):
+        await asyncio.to_thread(self._write, key, data)
+        self.total_bytes += len(data) - self._entries.pop(key, 0)
+        self._entries[key] = len(data)
+        self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._path(key).unlink(missing_ok=True)
+            self.total_bytes -= size
+
+class ObjectStoragePdfStore:
+    """PDF store backed by an S3-compatible bucket; eviction is left to bucket lifecycle rules"""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None):
+        import boto3  # Only needed when the object storage backend is enabled
+        self.bucket = bucket
+        self._s3 = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/invoices/{key}.pdf"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        def _get():
+            try:
+                return self._s3.get_object(Bucket=self.bucket, Key=f"invoices/{key}.pdf")["Body"].read()
+            except self._s3.exceptions.NoSuchKey:
+                return None
+        return await asyncio.to_thread(_get)
+
+    async def put(self, key: str, data: bytes):
+        await asyncio.to_thread(
+            self._s3.put_object,
+            Bucket=self.bucket,
+            Key=f"invoices/{key}.pdf",
+            Body=data,
+            ContentType="application/pdf",
+        )
+
+def create_pdf_store():
+    if PDF_CACHE_BACKEND == "s3":
+        return ObjectStoragePdfStore(PDF_CACHE_S3_BUCKET, PDF_CACHE_S3_ENDPOINT)
+    return DiskPdfStore(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+
+pdf_store = create_pdf_store()
+
+# PDF rendering pool
+# ReportLab is CPU-bound pure Python, so renders run in worker processes to
+# keep the event loop free. Only plain dicts cross the process boundary.
+def _render_invoice_pdf(invoice_dict: dict, user_profile: dict, user_info: dict) -> bytes:
+    return generate_invoice_pdf(Invoice(**invoice_dict), user_profile, user_info)
+
+class PdfRenderQueueFull(Exception):
+    pass
+
+class PdfRenderer:
+    """Dispatches PDF renders to a process pool with a bounded backlog.
+
+    A render only reaches the pool once a worker slot is free, so the timeout
+    covers the render itself; time spent waiting for a slot is reported
+    separately as queue_seconds.
+    """
+
+    def __init__(self, workers: int, timeout: float, max_queue: int):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self._executor = None
+        self._slots = asyncio.Semaphore(workers)
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.queue_seconds = Histogram()
+        self.render_seconds = Histogram()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # Spawned workers: forking would copy the Mongo client's threads and locks
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _render_finished(self, future: asyncio.Future):
+        # The slot is freed when the worker is really done, even after a timeout
+        self._slots.release()
+        if not future.cancelled():
+            future.exception()  # Retrieved here when nobody awaits it any more
+
+    async def render(self, invoice: Invoice, user_profile: dict, user_info: dict) -> bytes:
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            raise PdfRenderQueueFull()
+        profile_fields = {f: user_profile.get(f) for f in PDF_PROFILE_FIELDS}
+        user_fields = {f: user_info.get(f) for f in PDF_USER_FIELDS}
+        self.pending += 1
+        queued = time.perf_counter()
+        try:
+            await self._slots.acquire()
+            started = time.perf_counter()
+            self.queue_seconds.observe(started - queued)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._get_executor(), _render_invoice_pdf, invoice.model_dump(), profile_fields, user_fields
+            )
+            future.add_done_callback(self._render_finished)
+            try:
+                # On timeout the worker finishes the job in the background
+                return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            finally:
+                self.render_seconds.observe(time.perf_counter() - started)
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "queue_seconds": self.queue_seconds.snapshot(),
+            "render_seconds": self.render_seconds.snapshot(),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+pdf_renderer = PdfRenderer(PDF_RENDER_WORKERS, PDF_RENDER_TIMEOUT, PDF_RENDER_MAX_QUEUE)
+
+async def render_invoice_pdf(invoice: Invoice, user_profile: dict, user_info: dict) -> bytes:
+    """Render through the pool, mapping saturation and timeouts to HTTP errors"""
+    try:
+        return await pdf_renderer.render(invoice, user_profile, user_info)
+    except PdfRenderQueueFull:
+        raise HTTPException(status_code=429, detail="Trop de PDF en cours de génération, réessayez plus tard")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="La génération du PDF a expiré")
+
+async def get_or_render_pdf(invoice: Invoice, user_profile: dict, user_info: dict, store: bool = True) -> tuple:
+    """Return (cache key, PDF bytes), rendering only on a cache miss.
+
+    Bulk exports pass store=False so a one-off pass over every invoice does
+    not evict the PDFs users actually download.
+    """
+    pdf_key = pdf_cache_key(invoice, user_profile, user_info)
+    pdf_data = await pdf_store.get(pdf_key)
+    if pdf_data is None:
+        pdf_data = await render_invoice_pdf(invoice, user_profile, user_info)
+        if store:
+            await pdf_store.put(pdf_key, pdf_data)
+    return pdf_key, pdf_data
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check: weak comparison over a comma-separated list, or *"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
 @api_router.get("/invoices/{invoice_id}/pdf")
-async def download_invoice_pdf(invoice_id: str, user_id: str = Depends(verify_token)):
+async def download_invoice_pdf(invoice_id: str, request: Request, ctx: RequestContext = Depends(get_request_context)):
+    user_id = ctx.user_id
+    
     # Get invoice
     invoice_doc = await db.invoices.find_one({"id": invoice_id, "user_id": user_id})
     if not invoice_doc:
         raise HTTPException(status_code=404, detail="Facture non trouvée")
     
     # Get user profile and info
-    profile_doc = await db.profiles.find_one({"user_id": user_id})
-    user_doc = await db.users.find_one({"id": user_id})
+    profile_doc = await ctx.get_profile()
+    user_doc = await ctx.get_user()
     
     if not profile_doc or not user_doc:
         raise HTTPException(status_code=400, detail="Profil utilisateur requis")
     
-    # Generate PDF
     invoice = Invoice(**invoice_doc)
-    pdf_data = generate_invoice_pdf(invoice, profile_doc, user_doc)
-    
-    # Update invoice with PDF path (in a real system, save to S3/cloud storage)
+    pdf_key = pdf_cache_key(invoice, profile_doc, user_doc)
+    etag = f'"{pdf_key}"'
     pdf_filename = f"facture_{invoice.invoice_number}_{datetime.now().strftime('%Y%m%d')}.pdf"
-    await db.invoices.update_one(
-        {"id": invoice_id, "user_id": user_id},
-        {"$set": {"pdf_path": pdf_filename}}
-    )
+    
+    # Client already holds this exact document
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # Serve from cache, rendering only on a miss
+    pdf_key, pdf_data = await get_or_render_pdf(invoice, profile_doc, user_doc)
+    
+    pdf_location = pdf_store.location(pdf_key)
+    if invoice_doc.get("pdf_path") != pdf_location:
+        await db.invoices.update_one(
+            {"id": invoice_id, "user_id": user_id},
+            {"$set": {"pdf_path": pdf_location}}
+        )
     
     # Return PDF as response
     return Response(
         content=pdf_data,
         media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={pdf_filename}"}
+        headers={
+            "Content-Disposition": f"attachment; filename={pdf_filename}",
+            "Content-Length": str(len(pdf_data)),
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
+        }
+    )
+# Invoice numbering
+# One counter document per user and year, bumped atomically with $inc so
+# concurrent creates never share a number and no count scan is needed.
+def format_invoice_number(year: int, seq: int) -> str:
+    return f"FAC-{year}-{seq:04d}"
+
+async def _highest_invoice_seq(user_id: str, year: int) -> int:
+    # Compared as integers: by string, FAC-2026-9999 sorts above FAC-2026-10000
+    pipeline = [
+        {"$match": {"user_id": user_id, "invoice_number": {"$regex": f"^FAC-{year}-[0-9]+$"}}},
+        {"$group": {"_id": None, "seq": {"$max": {"$toLong": {"$arrayElemAt": [{"$split": ["$invoice_number", "-"]}, 2]}}}}},
+    ]
+    results = await db.invoices.aggregate(pipeline).to_list(1)
+    return (results[0]["seq"] or 0) if results else 0
+
+async def _seed_invoice_counter(user_id: str, year: int):
+    # First use for this user/year: continue after the highest number issued
+    # before counters existed so existing invoices keep unique numbers
+    seed = await _highest_invoice_seq(user_id, year)
+    try:
+        await db.invoice_counters.update_one(
+            {"_id": f"{user_id}:{year}"},
+            {"$setOnInsert": {"user_id": user_id, "year": year, "seq": seed}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        pass  # Another request seeded the counter first
+
+async def resync_invoice_counter(user_id: str, invoice_number: str):
+    """Move a counter past existing numbers after a duplicate-number insert"""
+    year = int(invoice_number.split("-")[1])
+    await db.invoice_counters.update_one(
+        {"_id": f"{user_id}:{year}"},
+        {"$max": {"seq": await _highest_invoice_seq(user_id, year)}},
     )
+
+async def reserve_invoice_numbers(user_id: str, count: int = 1, year: Optional[int] = None) -> List[str]:
+    """Reserve a contiguous block of invoice numbers for a user"""
+    year = year or datetime.now().year
+    counter = await db.invoice_counters.find_one_and_update(
+        {"_id": f"{user_id}:{year}"},
+        {"$inc": {"seq": count}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if counter is None:
+        await _seed_invoice_counter(user_id, year)
+        counter = await db.invoice_counters.find_one_and_update(
+            {"_id": f"{user_id}:{year}"},
+            {"$inc": {"seq": count}},
+            return_document=ReturnDocument.AFTER,
+        )
+    first_seq = counter["seq"] - count + 1
+    return [format_invoice_number(year, seq) for seq in range(first_seq, counter["seq"] + 1)]
+
+# Batch PDF export
+class InvoiceExportRequest(BaseModel):
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    status: Optional[str] = None
+    client_id: Optional[str] = None
+
+class _ZipChunkBuffer(io.RawIOBase):
+    """Write-only sink for zipfile; chunks are drained after each entry"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+async def _stream_invoice_zip(invoice_cursor, profile_doc: dict, user_doc: dict):
+    # Keep a small window of renders in flight and write them in cursor order,
+    # so at most `window` PDFs are held in memory at any time
+    window = max(1, min(PDF_RENDER_WORKERS * 2, PDF_RENDER_MAX_QUEUE // 2))
+    sink = _ZipChunkBuffer()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+    in_flight = []
+    
+    async def render(invoice_doc):
+        invoice = Invoice(**invoice_doc)
+        while True:
+            try:
+                _, pdf_data = await get_or_render_pdf(invoice, profile_doc, user_doc, store=False)
+                return invoice, pdf_data
+            except HTTPException as exc:
+                if exc.status_code != 429:
+                    raise
+                await asyncio.sleep(0.1)  # Pool saturated by other traffic
+    
+    async def write_oldest():
+        invoice, pdf_data = await in_flight.pop(0)
+        archive.writestr(f"facture_{invoice.invoice_number}.pdf", pdf_data)
+        return sink.drain()
+    
+    try:
+        async for invoice_doc in invoice_cursor:
+            in_flight.append(asyncio.ensure_future(render(invoice_doc)))
+            if len(in_flight) >= window:
+                yield await write_oldest()
+        while in_flight:
+            yield await write_oldest()
+        archive.close()
+        yield sink.drain()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+@api_router.post("/invoices/export")
+async def export_invoices(export_filter: InvoiceExportRequest, ctx: RequestContext = Depends(get_request_context)):
+    # Profile and user are fetched once for the whole archive
+    user_id = ctx.user_id
+    profile_doc = await ctx.get_profile()
+    user_doc = await ctx.get_user()
+    if not profile_doc or not user_doc:
+        raise HTTPException(status_code=400, detail="Profil utilisateur requis")
+    
+    query: Dict[str, Any] = {"user_id": user_id}
+    if export_filter.status:
+        query["status"] = export_filter.status
+    if export_filter.client_id:
+        query["client_id"] = export_filter.client_id
+    if export_filter.date_from or export_filter.date_to:
+        query["created_at"] = {}
+        if export_filter.date_from:
+            query["created_at"]["$gte"] = export_filter.date_from
+        if export_filter.date_to:
+            query["created_at"]["$lt"] = export_filter.date_to
+    
+    invoice_cursor = db.invoices.find(query, {"_id": 0}).sort([("created_at", -1), ("id", -1)])
+    archive_name = f"factures_{datetime.now().strftime('%Y%m%d')}.zip"
+    
+    return StreamingResponse(
+        _stream_invoice_zip(invoice_cursor, profile_doc, user_doc),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={archive_name}"}
+    )
+
+# Invoice creation
+VAT_RATE = 0.20  # 20% VAT for simplicity
+
+def compute_invoice_amounts(invoices_data: List[InvoiceCreate], vat_regime: str) -> List[tuple]:
+    """(amount_ht, vat_amount, amount_ttc) for each payload, in one pass over the batch"""
+    vat_rate = 0.0 if vat_regime == "franchise" else VAT_RATE
+    amounts = []
+    for invoice_data in invoices_data:
+        amount_ht = invoice_data.amount_ht  # Already checked against the lines
+        vat_amount = amount_ht * vat_rate
+        amounts.append((amount_ht, vat_amount, amount_ht + vat_amount))
+    return amounts
+
+def build_invoices(user_id: str, invoices_data: List[InvoiceCreate], invoice_numbers: List[str], vat_regime: str) -> List[Invoice]:
+    invoices = []
+    for invoice_data, invoice_number, (amount_ht, vat_amount, amount_ttc) in zip(
+        invoices_data, invoice_numbers, compute_invoice_amounts(invoices_data, vat_regime)
+    ):
+        invoice_dict = invoice_data.model_dump()
+        invoice_dict["amount_ht"] = amount_ht
+        invoices.append(Invoice(
+            user_id=user_id,
+            invoice_number=invoice_number,
+            vat_amount=vat_amount,
+            amount_ttc=amount_ttc,
+            **invoice_dict
+        ))
+    return invoices
+
 @api_router.post("/invoices", response_model=Invoice)
-async def create_invoice(invoice_data: InvoiceCreate, user_id: str = Depends(verify_token)):
+async def create_invoice(invoice_data: InvoiceCreate, ctx: RequestContext = Depends(get_request_context)):
     # Get user profile for VAT calculation
-    profile = await db.profiles.find_one({"user_id": user_id})
+    user_id = ctx.user_id
+    profile = await ctx.get_profile()
     if not profile:
         raise HTTPException(status_code=400, detail="Profil utilisateur requis")
     
     # Generate invoice number
-    count = await db.invoices.count_documents({"user_id": user_id})
-    invoice_number = f"FAC-{datetime.now().year}-{count + 1:04d}"
+    invoice_numbers = await reserve_invoice_numbers(user_id)
     
-    # Calculate VAT and total
-    vat_amount = 0.0
-    if profile["vat_regime"] != "franchise":
-        vat_amount = invoice_data.amount_ht * 0.20  # 20% VAT for simplicity
+    invoice_obj = build_invoices(user_id, [invoice_data], invoice_numbers, profile["vat_regime"])[0]
     
-    amount_ttc = invoice_data.amount_ht + vat_amount
+    invoice_doc = invoice_obj.model_dump()
+    try:
+        await db.invoices.insert_one(invoice_doc)
+    except DuplicateKeyError:
+        # The counter was behind numbers already in use: catch it up and retry once
+        await resync_invoice_counter(user_id, invoice_obj.invoice_number)
+        invoice_obj.invoice_number = (await reserve_invoice_numbers(user_id))[0]
+        invoice_doc = invoice_obj.model_dump()
+        try:
+            await db.invoices.insert_one(invoice_doc)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Numéro de facture déjà utilisé, veuillez réessayer")
+    await track_client_stats([(None, invoice_doc)])
+    return invoice_obj
+
+MAX_INVOICE_BATCH = 500
+
+@api_router.post("/invoices:batch")
+async def create_invoices_batch(payloads: List[Dict[str, Any]], ctx: RequestContext = Depends(get_request_context)):
+    if not payloads:
+        raise HTTPException(status_code=400, detail="Aucune facture à créer")
+    if len(payloads) > MAX_INVOICE_BATCH:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_INVOICE_BATCH} factures par lot")
+    
+    user_id = ctx.user_id
+    profile = await ctx.get_profile()
+    if not profile:
+        raise HTTPException(status_code=400, detail="Profil utilisateur requis")
     
-    invoice_dict = invoice_data.model_dump()
-    invoice_obj = Invoice(
-        user_id=user_id,
-        invoice_number=invoice_number,
-        vat_amount=vat_amount,
-        amount_ttc=amount_ttc,
-        **invoice_dict
-    )
+    # Validate each item separately so one bad payload does not reject the batch
+    results: List[Dict[str, Any]] = [None] * len(payloads)
+    valid_positions = []
+    valid_data = []
+    for position, payload in enumerate(payloads):
+        try:
+            valid_data.append(InvoiceCreate.model_validate(payload))
+            valid_positions.append(position)
+        except ValidationError as exc:
+            results[position] = {"index": position, "status": "error", "detail": exc.errors(include_url=False)}
+    
+    if valid_data:
+        # One contiguous block of numbers, one ordered insert
+        invoice_numbers = await reserve_invoice_numbers(user_id, count=len(valid_data))
+        invoices = build_invoices(user_id, valid_data, invoice_numbers, profile["vat_regime"])
+        invoice_docs = [invoice.model_dump() for invoice in invoices]
+        inserted = len(invoices)
+        failure = None
+        try:
+            await db.invoices.insert_many(invoice_docs, ordered=True)
+        except BulkWriteError as exc:
+            # Ordered insert stops at the first failure; later items were not attempted
+            inserted = exc.details.get("nInserted", 0)
+            failure = exc.details["writeErrors"][0]["errmsg"] if exc.details.get("writeErrors") else str(exc)
+            if any(error.get("code") == 11000 for error in exc.details.get("writeErrors", [])):
+                await resync_invoice_counter(user_id, invoices[inserted].invoice_number)
+        await track_client_stats([(None, invoice_doc) for invoice_doc in invoice_docs[:inserted]])
+        
+        for offset, (position, invoice) in enumerate(zip(valid_positions, invoices)):
+            if offset < inserted:
+                results[position] = {"index": position, "status": "created", "invoice": invoice}
+            elif offset == inserted and failure:
+                results[position] = {"index": position, "status": "error", "detail": failure}
+            else:
+                results[position] = {"index": position, "status": "skipped", "detail": "Non traitée après une erreur"}
+    
+    created = sum(1 for result in results if result["status"] == "created")
+    return {"message": f"{created} facture(s) créée(s)", "results": results}
+
+# Recurring invoices
+# Templates are materialized by a scheduler pass that works on pages of due
+# templates across all users: one profiles query per page, one numbering
+# block per user, one insert_many for the invoices and one bulk_write to
+# advance the templates. Generated invoice ids are derived from the template
+# and period, so a pass interrupted between the two writes cannot duplicate.
+@api_router.post("/recurring-invoices", response_model=RecurringInvoice)
+async def create_recurring_invoice(template_data: RecurringInvoiceCreate, user_id: str = Depends(verify_token)):
+    template = RecurringInvoice(user_id=user_id, next_run_date=template_data.start_date, **template_data.model_dump())
+    await db.recurring_invoices.insert_one(template.model_dump())
+    return template
+
+@api_router.get("/recurring-invoices", response_model=List[RecurringInvoice])
+async def get_recurring_invoices(user_id: str = Depends(verify_token)):
+    templates = await db.recurring_invoices.find({"user_id": user_id}).sort("created_at", -1).to_list(MAX_PAGE_SIZE)
+    return [RecurringInvoice(**template) for template in templates]
+
+@api_router.delete("/recurring-invoices/{template_id}")
+async def delete_recurring_invoice(template_id: str, user_id: str = Depends(verify_token)):
+    result = await db.recurring_invoices.delete_one({"id": template_id, "user_id": user_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Facture récurrente non trouvée")
+    return {"message": "Facture récurrente supprimée"}
+
+def _occurrence_date(template: dict, index: int) -> datetime:
+    # Always offset from start_date: stepping from the previous run would
+    # turn a Jan 31 start into the 28th for good after February
+    return template["start_date"] + relativedelta(months=RECURRING_CADENCES[template["cadence"]] * index)
+
+def _due_occurrences(template: dict, now: datetime) -> List[datetime]:
+    """Every run date up to now, so missed periods are caught up"""
+    occurrences = []
+    index = template.get("occurrence_count", 0)
+    run_date = _occurrence_date(template, index)
+    while run_date <= now and len(occurrences) < 12:
+        occurrences.append(run_date)
+        index += 1
+        run_date = _occurrence_date(template, index)
+    return occurrences
+
+def _recurring_invoice_id(template: dict, run_date: datetime) -> str:
+    return f"rec-{template['id']}-{run_date.strftime('%Y%m%d')}"
+
+async def _insert_generated_invoices(invoice_docs: List[dict]) -> tuple:
+    """Insert generated invoices; returns (inserted docs, ids already present).
     
-    await db.invoices.insert_one(invoice_obj.model_dump())
-    return invoice_obj
+    A duplicate derived id means an interrupted pass already wrote the
+    invoice. Any other duplicate is a number collision from a counter that
+    was behind: the counter is resynced and those invoices are renumbered and
+    retried once.
+    """
+    inserted: List[dict] = []
+    existing: set = set()
+    for attempt in range(2):
+        failed: set = set()
+        try:
+            await db.invoices.insert_many(invoice_docs, ordered=False)
+        except BulkWriteError as exc:
+            if any(error.get("code") != 11000 for error in exc.details.get("writeErrors", [])):
+                raise
+            failed = {error["index"] for error in exc.details["writeErrors"]}
+        inserted.extend(doc for index, doc in enumerate(invoice_docs) if index not in failed)
+        retry = [invoice_docs[index] for index in sorted(failed)]
+        if not retry:
+            break
+        already = await db.invoices.find(
+            {"user_id": {"$in": list({doc["user_id"] for doc in retry})}, "id": {"$in": [doc["id"] for doc in retry]}},
+            {"_id": 0, "id": 1}
+        ).to_list(len(retry))
+        existing.update(doc["id"] for doc in already)
+        invoice_docs = [doc for doc in retry if doc["id"] not in existing]
+        if not invoice_docs or attempt == 1:
+            if invoice_docs:
+                logger.error(f"Recurring invoices {[doc['id'] for doc in invoice_docs]} still collide after renumbering")
+            break
+        
+        by_counter: Dict[tuple, List[dict]] = {}
+        for doc in invoice_docs:
+            by_counter.setdefault((doc["user_id"], int(doc["invoice_number"].split("-")[1])), []).append(doc)
+        for (user_id, year), docs in by_counter.items():
+            await resync_invoice_counter(user_id, docs[0]["invoice_number"])
+            numbers = await reserve_invoice_numbers(user_id, count=len(docs), year=year)
+            for doc, invoice_number in zip(docs, numbers):
+                doc["invoice_number"] = invoice_number
+    return inserted, existing
 
-@api_router.get("/invoices", response_model=List[Invoice])
-async def get_invoices(user_id: str = Depends(verify_token)):
-    invoices = await db.invoices.find({"user_id": user_id}).sort("created_at", -1).to_list(100)
+async def run_recurring_invoices(now: Optional[datetime] = None, batch_size: int = RECURRING_INVOICES_BATCH_SIZE) -> int:
+    now = now or datetime.utcnow()
+    created = 0
+    after = None
+    while True:
+        query: Dict[str, Any] = {"active": True, "next_run_date": {"$lte": now}}
+        if after:
+            query = {"$and": [query, keyset_filter("next_run_date", ASCENDING, after)]}
+        templates = await db.recurring_invoices.find(query, {"_id": 0}).sort(
+            [("next_run_date", 1), ("id", 1)]
+        ).limit(batch_size).to_list(batch_size)
+        if not templates:
+            break
+        after = {"next_run_date": templates[-1]["next_run_date"], "id": templates[-1]["id"]}
+        
+        user_ids = list({template["user_id"] for template in templates})
+        profiles = {
+            profile["user_id"]: profile
+            for profile in await db.profiles.find({"user_id": {"$in": user_ids}}).to_list(len(user_ids))
+        }
+        
+        # Group due occurrences per user and year so each reserves one number
+        # block; catch-up runs are numbered in the year they are dated
+        due: List[tuple] = []
+        occurrences_by_counter: Dict[tuple, List[tuple]] = {}
+        for template in templates:
+            if template["user_id"] not in profiles:
+                continue  # No VAT regime to bill with yet
+            occurrences = _due_occurrences(template, now)
+            if not occurrences:
+                continue
+            due.append((template, occurrences))
+            for run_date in occurrences:
+                occurrences_by_counter.setdefault((template["user_id"], run_date.year), []).append((template, run_date))
+        
+        invoice_docs = []
+        for (user_id, year), occurrences in occurrences_by_counter.items():
+            invoice_numbers = await reserve_invoice_numbers(user_id, count=len(occurrences), year=year)
+            invoices_data = [
+                InvoiceCreate(
+                    client_id=template.get("client_id"),
+                    client_name=template["client_name"],
+                    client_email=template["client_email"],
+                    client_address=template["client_address"],
+                    amount_ht=template["amount_ht"],
+                    description=template["description"],
+                    lines=template.get("lines", []),
+                    due_date=run_date + timedelta(days=template.get("due_days", 30))
+                )
+                for template, run_date in occurrences
+            ]
+            built = build_invoices(user_id, invoices_data, invoice_numbers, profiles[user_id]["vat_regime"])
+            for invoice, (template, run_date) in zip(built, occurrences):
+                invoice.id = _recurring_invoice_id(template, run_date)
+                invoice.created_at = run_date
+                invoice_docs.append(invoice.model_dump())
+        
+        inserted, existing = await _insert_generated_invoices(invoice_docs) if invoice_docs else ([], set())
+        await track_client_stats([(None, invoice_doc) for invoice_doc in inserted])
+        created += len(inserted)
+        
+        # Advance each template past the occurrences actually written, in order
+        written = {doc["id"] for doc in inserted} | existing
+        template_updates = []
+        for template, occurrences in due:
+            generated = 0
+            while generated < len(occurrences) and _recurring_invoice_id(template, occurrences[generated]) in written:
+                generated += 1
+            if not generated:
+                continue
+            occurrence_count = template.get("occurrence_count", 0) + generated
+            template_updates.append(UpdateOne(
+                {"id": template["id"], "next_run_date": template["next_run_date"]},
+                {"$set": {
+                    "next_run_date": _occurrence_date(template, occurrence_count),
+                    "last_run_date": occurrences[generated - 1],
+                    "occurrence_count": occurrence_count,
+                }}
+            ))
+        if template_updates:
+            await db.recurring_invoices.bulk_write(template_updates, ordered=False)
+        
+        if len(templates) < batch_size:
+            break
+    return created
+
+async def recurring_invoice_loop():
+    while True:
+        try:
+            if await acquire_lease("recurring_invoices", RECURRING_INVOICES_INTERVAL):
+                created = await run_recurring_invoices()
+                logger.info(f"Recurring invoice pass created {created} invoices")
+        except Exception:
+            logger.exception("Recurring invoice pass failed")
+        await asyncio.sleep(RECURRING_INVOICES_INTERVAL)
+
+@api_router.get("/invoices")
+async def get_invoices(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    client_id: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    user_id: str = Depends(verify_token)
+):
+    query: Dict[str, Any] = {"user_id": user_id}
+    if status:
+        query["status"] = status
+    if client_id:
+        query["client_id"] = client_id
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = created_from
+        if created_to:
+            query["created_at"]["$lt"] = created_to
+    if cursor:
+        after = decode_cursor(cursor, "created_at", datetime_fields=("created_at",))
+        query = {"$and": [query, keyset_filter("created_at", DESCENDING, after)]}
+    projection = parse_fields(fields, Invoice, ("id", "created_at"))
+    
+    invoices = await db.invoices.find(query, projection).sort([("created_at", -1), ("id", -1)]).limit(limit).to_list(limit)
+    if len(invoices) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"created_at": invoices[-1]["created_at"], "id": invoices[-1]["id"]})
+    
+    if projection:
+        return invoices
     return [Invoice(**invoice) for invoice in invoices]
 
+# Revenue rollups
+# One document per user and year holding the paid TTC total and a per-month
+# breakdown, kept in step with invoice status changes so the dashboard reads
+# a single small document. A missing rollup (a user or year not seen since
+# rollups were introduced) is built from the invoices on first use, and
+# rebuild_revenue_rollups() recomputes them all.
+def _rollup_key(user_id: str, year: int) -> str:
+    return f"{user_id}:{year}"
+
+async def build_revenue_rollup(user_id: str, year: int) -> Optional[dict]:
+    """Create a missing rollup from the invoices; None if another writer created it first"""
+    pipeline = [
+        {"$match": {
+            "user_id": user_id,
+            "status": "paid",
+            "paid_at": {"$gte": datetime(year, 1, 1), "$lt": datetime(year + 1, 1, 1)}
+        }},
+        {"$group": {"_id": {"$month": "$paid_at"}, "total": {"$sum": "$amount_ttc"}, "count": {"$sum": 1}}},
+    ]
+    rows = await db.invoices.aggregate(pipeline).to_list(12)
+    rollup = {
+        "_id": _rollup_key(user_id, year),
+        "user_id": user_id,
+        "year": year,
+        "total": sum(row["total"] for row in rows),
+        "months": {f"{row['_id']:02d}": row["total"] for row in rows},
+        "invoice_count": sum(row["count"] for row in rows),
+        "updated_at": datetime.utcnow(),
+    }
+    try:
+        await db.revenue_rollups.insert_one(rollup)
+    except DuplicateKeyError:
+        return None
+    return rollup
+
+async def apply_revenue_delta(user_id: str, paid_at: datetime, amount: float) -> bool:
+    """Increment the rollup; False when it was missing and has been built instead"""
+    result = await db.revenue_rollups.update_one(
+        {"_id": _rollup_key(user_id, paid_at.year)},
+        {
+            "$inc": {
+                "total": amount,
+                f"months.{paid_at.month:02d}": amount,
+                "invoice_count": 1 if amount >= 0 else -1,
+            },
+            "$set": {"updated_at": datetime.utcnow()},
+        },
+    )
+    if result.matched_count:
+        return True
+    # The invoice write is already visible, so a freshly built rollup includes
+    # this change; if a concurrent build won, apply the delta to it instead
+    if await build_revenue_rollup(user_id, paid_at.year) is None:
+        return await apply_revenue_delta(user_id, paid_at, amount)
+    return False
+
+async def track_paid_transition(before: Optional[dict], after: Optional[dict]):
+    """Move an invoice's amount in/out of the rollups when its paid state changes"""
+    deltas = []
+    if before and before.get("status") == "paid" and before.get("paid_at"):
+        deltas.append((before["user_id"], before["paid_at"], -before["amount_ttc"]))
+    if after and after.get("status") == "paid" and after.get("paid_at"):
+        deltas.append((after["user_id"], after["paid_at"], after["amount_ttc"]))
+    built = set()
+    for user_id, paid_at, amount in deltas:
+        # A rollup built during this transition already reflects its final state
+        if (user_id, paid_at.year) in built:
+            continue
+        if not await apply_revenue_delta(user_id, paid_at, amount):
+            built.add((user_id, paid_at.year))
+
+async def get_yearly_revenue(user_id: str, year: int) -> Dict[str, Any]:
+    rollup = await db.revenue_rollups.find_one({"_id": _rollup_key(user_id, year)})
+    if not rollup:
+        rollup = await build_revenue_rollup(user_id, year) or await db.revenue_rollups.find_one({"_id": _rollup_key(user_id, year)})
+    if not rollup:
+        # Dropped again by a concurrent rebuild, which is about to recreate it
+        rollup = await build_revenue_rollup(user_id, year) or {}
+    return {
+        "total": rollup.get("total", 0.0),
+        "months": rollup.get("months", {}),
+        "invoice_count": rollup.get("invoice_count", 0),
+    }
+
+async def rebuild_revenue_rollups(user_id: Optional[str] = None) -> int:
+    """Recompute rollups one (user, year) key at a time.
+
+    Each key is dropped then rebuilt through build_revenue_rollup, so readers
+    and deltas running meanwhile only ever see a complete rollup or a missing
+    one, which they build lazily themselves.
+    """
+    match = {"status": "paid", "paid_at": {"$type": "date"}}
+    if user_id:
+        match["user_id"] = user_id
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": {"user_id": "$user_id", "year": {"$year": "$paid_at"}}}},
+    ]
+    keys = {(row["_id"]["user_id"], row["_id"]["year"]) async for row in db.invoices.aggregate(pipeline)}
+
+    # Rollups left without any paid invoice
+    async for rollup in db.revenue_rollups.find({"user_id": user_id} if user_id else {}, {"user_id": 1, "year": 1}):
+        if (rollup["user_id"], rollup["year"]) not in keys:
+            await db.revenue_rollups.delete_one({"_id": rollup["_id"]})
+
+    for key_user_id, year in keys:
+        await db.revenue_rollups.delete_one({"_id": _rollup_key(key_user_id, year)})
+        await build_revenue_rollup(key_user_id, year)
+    return len(keys)
+
+# Dashboard revenue computation
+def _threshold_percents(total: float, profile: dict) -> Dict[str, float]:
+    return {
+        "micro_threshold_percent": (total / profile["micro_threshold"]) * 100,
+        "vat_threshold_percent": (total / profile["vat_threshold"]) * 100,
+    }
+
+async def _revenue_python_sum(user_id: str, profile: dict, year: int) -> Dict[str, Any]:
+    # Baseline: fetch every paid invoice of the year and sum client-side
+    months: Dict[str, float] = {}
+    total = 0.0
+    async for invoice in db.invoices.find({
+        "user_id": user_id,
+        "status": "paid",
+        "paid_at": {"$gte": datetime(year, 1, 1), "$lt": datetime(year + 1, 1, 1)}
+    }):
+        month = f"{invoice['paid_at'].month:02d}"
+        months[month] = months.get(month, 0.0) + invoice["amount_ttc"]
+        total += invoice["amount_ttc"]
+    return {"total": total, "months": months, **_threshold_percents(total, profile)}
+
+async def _revenue_aggregate(user_id: str, profile: dict, year: int) -> Dict[str, Any]:
+    # Only the totals cross the wire; thresholds are applied in the pipeline
+    pipeline = [
+        {"$match": {
+            "user_id": user_id,
+            "status": "paid",
+            "paid_at": {"$gte": datetime(year, 1, 1), "$lt": datetime(year + 1, 1, 1)}
+        }},
+        {"$group": {"_id": {"$month": "$paid_at"}, "total": {"$sum": "$amount_ttc"}}},
+        {"$group": {"_id": None, "total": {"$sum": "$total"}, "months": {"$push": {"month": "$_id", "total": "$total"}}}},
+        {"$project": {
+            "total": 1,
+            "months": 1,
+            "micro_threshold_percent": {"$multiply": [{"$divide": ["$total", profile["micro_threshold"]]}, 100]},
+            "vat_threshold_percent": {"$multiply": [{"$divide": ["$total", profile["vat_threshold"]]}, 100]},
+        }},
+    ]
+    results = await db.invoices.aggregate(pipeline).to_list(1)
+    if not results:
+        return {"total": 0.0, "months": {}, **_threshold_percents(0.0, profile)}
+    result = results[0]
+    return {
+        "total": result["total"],
+        "months": {f"{m['month']:02d}": m["total"] for m in result["months"]},
+        "micro_threshold_percent": result["micro_threshold_percent"],
+        "vat_threshold_percent": result["vat_threshold_percent"],
+    }
+
+async def _revenue_rollup(user_id: str, profile: dict, year: int) -> Dict[str, Any]:
+    yearly_revenue = await get_yearly_revenue(user_id, year)
+    return {
+        "total": yearly_revenue["total"],
+        "months": yearly_revenue["months"],
+        **_threshold_percents(yearly_revenue["total"], profile),
+    }
+
+REVENUE_STRATEGIES = {
+    "python-sum": _revenue_python_sum,
+    "aggregate": _revenue_aggregate,
+    "rollup": _revenue_rollup,
+}
+
+async def compute_revenue_summary(user_id: str, profile: dict, year: Optional[int] = None, strategy: Optional[str] = None) -> Dict[str, Any]:
+    strategy = strategy or DASHBOARD_REVENUE_STRATEGY
+    if strategy not in REVENUE_STRATEGIES:
+        raise ValueError(f"Unknown revenue strategy: {strategy}")
+    return await REVENUE_STRATEGIES[strategy](user_id, profile, year or datetime.utcnow().year)
+
 @api_router.put("/invoices/{invoice_id}/status")
 async def update_invoice_status(invoice_id: str, status: str, user_id: str = Depends(verify_token)):
     if status not in ["draft", "sent", "paid", "overdue"]:
@@ -720,37 +3058,78 @@ async def update_invoice_status(invoice_id: str, status: str, user_id: str = Dep
     if status == "paid":
         update_data["paid_at"] = datetime.utcnow()
     
-    result = await db.invoices.update_one(
+    previous = await db.invoices.find_one_and_update(
         {"id": invoice_id, "user_id": user_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Facture non trouvée")
     
+    await track_paid_transition(previous, {**previous, **update_data})
+    await track_client_stats([(previous, {**previous, **update_data})])
+    await publish_invoice_status(user_id, invoice_id, status)
+    
     return {"message": "Statut mis à jour"}
 
+# Live updates stream (Server-Sent Events)
+async def _event_stream(request: Request, user_id: str):
+    queue = live_events.subscribe(user_id)
+    try:
+        # Initial state so clients do not need a separate fetch
+        snapshot = await dashboard_snapshot(user_id)
+        if snapshot:
+            yield f"event: dashboard\ndata: {json.dumps(snapshot, default=str)}\n\n"
+        yield f"event: unread\ndata: {json.dumps({'unread': await get_unread_count(user_id)})}\n\n"
+        
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=LIVE_EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+    finally:
+        live_events.unsubscribe(user_id, queue)
+
+@api_router.get("/events/stream")
+async def stream_events(request: Request, user_id: str = Depends(verify_token)):
+    return StreamingResponse(
+        _event_stream(request, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/admin/query-plans")
+async def get_query_plans(user_id: str = Depends(verify_admin)):
+    return await explain_route_queries(user_id)
+
+@api_router.get("/admin/profiles")
+async def list_slow_request_profiles(user_id: str = Depends(verify_admin)):
+    return await asyncio.to_thread(profile_store.list)
+
+@api_router.get("/admin/profiles/{report_id}")
+async def get_slow_request_profile(report_id: str, user_id: str = Depends(verify_admin)):
+    report = await asyncio.to_thread(profile_store.get, report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profil de requête non trouvé")
+    return report
+
 # Dashboard Routes
 @api_router.get("/dashboard")
-async def get_dashboard(user_id: str = Depends(verify_token)):
+async def get_dashboard(ctx: RequestContext = Depends(get_request_context)):
     # Get user profile
-    profile = await db.profiles.find_one({"user_id": user_id})
+    user_id = ctx.user_id
+    profile = await ctx.get_profile()
     if not profile:
         raise HTTPException(status_code=404, detail="Profil non trouvé")
     
-    # Calculate current year revenue
-    start_of_year = datetime(datetime.now().year, 1, 1)
-    invoices = await db.invoices.find({
-        "user_id": user_id,
-        "status": "paid",
-        "paid_at": {"$gte": start_of_year}
-    }).to_list(1000)
-    
-    current_revenue = sum(invoice["amount_ttc"] for invoice in invoices)
-    
-    # Calculate thresholds percentages
-    micro_threshold_percent = (current_revenue / profile["micro_threshold"]) * 100
-    vat_threshold_percent = (current_revenue / profile["vat_threshold"]) * 100
+    # Current year revenue and threshold percentages
+    revenue = await compute_revenue_summary(user_id, profile)
+    current_revenue = revenue["total"]
+    micro_threshold_percent = revenue["micro_threshold_percent"]
+    vat_threshold_percent = revenue["vat_threshold_percent"]
     
     # Get next obligations
     next_obligations = await db.obligations.find({
@@ -786,6 +3165,7 @@ async def get_dashboard(user_id: str = Depends(verify_token)):
     
     return {
         "current_revenue": current_revenue,
+        "monthly_revenue": revenue["months"],
         "micro_threshold": profile["micro_threshold"],
         "vat_threshold": profile["vat_threshold"],
         "micro_threshold_percent": min(micro_threshold_percent, 100),
@@ -799,9 +3179,10 @@ async def get_dashboard(user_id: str = Depends(verify_token)):
 
 # Mock data initialization
 @api_router.post("/mock/init-obligations")
-async def init_mock_obligations(user_id: str = Depends(verify_token)):
+async def init_mock_obligations(ctx: RequestContext = Depends(get_request_context)):
     # Get user profile
-    profile = await db.profiles.find_one({"user_id": user_id})
+    user_id = ctx.user_id
+    profile = await ctx.get_profile()
     if not profile:
         raise HTTPException(status_code=404, detail="Profil non trouvé")
     
@@ -873,8 +3254,214 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Request metrics
+class RequestMetrics:
+    def __init__(self):
+        self.in_flight = 0
+        self.latency: Dict[tuple, Histogram] = {}
+        self.responses: Dict[tuple, int] = {}
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float):
+        key = (method, route)
+        if key not in self.latency:
+            self.latency[key] = Histogram()
+        self.latency[key].observe(seconds)
+        response_key = (method, route, status_code)
+        self.responses[response_key] = self.responses.get(response_key, 0) + 1
+
+request_metrics = RequestMetrics()
+METRIC_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"}
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    request_metrics.in_flight += 1
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        request_metrics.in_flight -= 1
+        # Label by route template and known methods so clients cannot explode the series count
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        method = request.method if request.method in METRIC_METHODS else "other"
+        request_metrics.observe(method, route_path, status_code, time.perf_counter() - started)
+
+# Slow request profiling
+# Every /api request carries a RequestTrace collecting its Mongo commands and
+# model construction time; a sampled fraction also gets event loop stack
+# samples. Requests over the latency budget are written to a rotating store.
+class StackSampler:
+    """Samples the event loop thread's stack while sampled requests are in flight"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._target_thread_id = None
+
+    def attach(self, trace: RequestTrace):
+        with self._lock:
+            self._active.add(trace)
+            self._target_thread_id = threading.get_ident()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def detach(self, trace: RequestTrace):
+        with self._lock:
+            self._active.discard(trace)
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        stack = []
+        while frame is not None and len(stack) < 40:
+            code = frame.f_code
+            stack.append(f"{Path(code.co_filename).name}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                traces = list(self._active)
+                frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            stack = self._collapse(frame)
+            for trace in traces:
+                trace.samples[stack] = trace.samples.get(stack, 0) + 1
+
+stack_sampler = StackSampler(PROFILING_SAMPLE_INTERVAL)
+
+class ProfileStore:
+    """Keeps the most recent slow request reports as JSON files"""
+
+    def __init__(self, directory: Path, max_reports: int):
+        self.directory = directory
+        self.max_reports = max_reports
+
+    def _write(self, report: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{report['id']}.json").write_text(json.dumps(report, default=str))
+        reports = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for stale in reports[:-self.max_reports]:
+            stale.unlink(missing_ok=True)
+
+    async def save(self, report: dict):
+        await asyncio.to_thread(self._write, report)
+
+    def list(self) -> List[dict]:
+        if not self.directory.exists():
+            return []
+        summaries = []
+        for path in sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+            report = json.loads(path.read_text())
+            summaries.append({k: report[k] for k in ("id", "timestamp", "method", "route", "status", "duration_ms")})
+        return summaries
+
+    def get(self, report_id: str) -> Optional[dict]:
+        path = self.directory / f"{Path(report_id).name}.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+profile_store = ProfileStore(PROFILING_DIR, PROFILING_MAX_REPORTS)
+
+def build_profile_report(request: Request, status_code: int, duration_ms: float, trace: RequestTrace) -> dict:
+    route = request.scope.get("route")
+    mongo_total_ms = sum(command["duration_ms"] for command in trace.mongo_commands)
+    top_stacks = sorted(trace.samples.items(), key=lambda item: item[1], reverse=True)[:30]
+    return {
+        "id": f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}",
+        "timestamp": datetime.utcnow().isoformat(),
+        "method": request.method,
+        "path": request.url.path,
+        "route": route.path if route is not None else None,
+        "status": status_code,
+        "duration_ms": duration_ms,
+        "mongo_commands": trace.mongo_commands,
+        "mongo_total_ms": mongo_total_ms,
+        "model_build_ms": trace.model_seconds * 1000,
+        "model_count": trace.model_count,
+        "sampled": trace.sampled,
+        "stack_samples": [{"stack": stack, "count": count} for stack, count in top_stacks],
+    }
+
+@app.middleware("http")
+async def profile_slow_requests(request: Request, call_next):
+    if not PROFILING_ENABLED or not request.url.path.startswith("/api"):
+        return await call_next(request)
+    
+    trace = RequestTrace(sampled=random.random() < PROFILING_SAMPLE_RATE)
+    token = current_trace.set(trace)
+    if trace.sampled:
+        stack_sampler.attach(trace)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        if trace.sampled:
+            stack_sampler.detach(trace)
+        current_trace.reset(token)
+        if duration_ms > PROFILING_LATENCY_BUDGET_MS:
+            try:
+                await profile_store.save(build_profile_report(request, status_code, duration_ms, trace))
+            except OSError:
+                logger.exception("Could not store slow request profile")
+
+def render_prometheus_metrics() -> str:
+    lines = [
+        "# HELP http_requests_in_flight Requests currently being handled",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {request_metrics.in_flight}",
+        "# HELP http_request_duration_seconds Request latency by route",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), histogram in sorted(request_metrics.latency.items()):
+        lines.extend(histogram.prometheus_lines("http_request_duration_seconds", {"method": method, "route": route}))
+    lines += ["# HELP http_responses_total Responses by route and status", "# TYPE http_responses_total counter"]
+    for (method, route, status_code), count in sorted(request_metrics.responses.items()):
+        lines.append(f'http_responses_total{{method="{method}",route="{route}",status="{status_code}"}} {count}')
+    
+    lines += ["# HELP mongo_command_duration_seconds MongoDB command latency", "# TYPE mongo_command_duration_seconds histogram"]
+    for (collection, command), histogram in sorted(mongo_metrics.histograms.items()):
+        lines.extend(histogram.prometheus_lines("mongo_command_duration_seconds", {"collection": collection, "command": command}))
+    lines += ["# HELP mongo_command_failures_total Failed MongoDB commands", "# TYPE mongo_command_failures_total counter"]
+    for (collection, command), count in sorted(mongo_metrics.failures.items()):
+        lines.append(f'mongo_command_failures_total{{collection="{collection}",command="{command}"}} {count}')
+    
+    lines += ["# HELP pdf_render_duration_seconds Invoice PDF render time", "# TYPE pdf_render_duration_seconds histogram"]
+    lines.extend(pdf_renderer.render_seconds.prometheus_lines("pdf_render_duration_seconds", {}))
+    lines += ["# HELP pdf_render_queue_seconds Wait for a free PDF worker", "# TYPE pdf_render_queue_seconds histogram"]
+    lines.extend(pdf_renderer.queue_seconds.prometheus_lines("pdf_render_queue_seconds", {}))
+    lines += ["# HELP pdf_render_pending PDF renders queued or running", "# TYPE pdf_render_pending gauge"]
+    lines.append(f"pdf_render_pending {pdf_renderer.pending}")
+    
+    lines += ["# HELP bcrypt_duration_seconds Password hash/verify time", "# TYPE bcrypt_duration_seconds histogram"]
+    lines.extend(password_hasher.seconds.prometheus_lines("bcrypt_duration_seconds", {}))
+    lines += ["# HELP bcrypt_queue_depth Password operations waiting for a worker", "# TYPE bcrypt_queue_depth gauge"]
+    lines.append(f"bcrypt_queue_depth {password_hasher.waiting}")
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_prometheus_metrics(), media_type="text/plain; version=0.0.4")
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -882,6 +3469,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_ensure_indexes():
+    try:
+        result = await ensure_indexes()
+    except PyMongoError as exc:
+        logger.error(f"Index provisioning failed: {exc}")
+        return
+    # Existing duplicates block unique indexes; keep serving and report them
+    for collection_name, errors in result["failed"].items():
+        for error in errors:
+            logger.error(f"Index provisioning failed on {collection_name}: {error}")
+    if not result["failed"]:
+        logger.info("MongoDB indexes ensured")
+
+background_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_background_workers():
+    background_tasks.append(asyncio.create_task(client_stats_backfill_loop()))
+    if AUTO_REMINDERS_ENABLED:
+        background_tasks.append(asyncio.create_task(auto_reminder_loop()))
+    if OUTBOX_ENABLED and SMTP_HOST:
+        background_tasks.append(asyncio.create_task(outbox_loop()))
+    if NOTIFICATION_SCHEDULER_ENABLED:
+        background_tasks.append(asyncio.create_task(notification_scheduler_loop()))
+    if LIVE_EVENTS_CHANGE_STREAMS:
+        background_tasks.append(asyncio.create_task(watch_changes()))
+    if RECURRING_INVOICES_ENABLED:
+        background_tasks.append(asyncio.create_task(recurring_invoice_loop()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for task in background_tasks:
+        task.cancel()
+    client.close()
+    password_hasher.shutdown()
+    pdf_renderer.shutdown()
+    outbox_sender.pool.close()
+
+# Command line maintenance tasks: python server.py <command>
+async def _run_command(args):
+    if args.command == "ensure-indexes":
+        result = await ensure_indexes()
+        print(json.dumps(result, indent=2))
+        if result["failed"]:
+            sys.exit(1)
+    elif args.command == "explain":
+        report = await explain_route_queries(args.user_id)
+        print(json.dumps(report, indent=2))
+    elif args.command == "auto-reminders":
+        reminders_sent = await run_auto_reminders(batch_size=args.batch_size)
+        print(f"{reminders_sent} reminders sent")
+    elif args.command == "run-workers":
+        workers = [auto_reminder_loop(), notification_scheduler_loop(), recurring_invoice_loop()]
+        if SMTP_HOST:
+            workers.append(outbox_loop())
+        await asyncio.gather(*workers)
+    elif args.command == "recurring-invoices":
+        created = await run_recurring_invoices(batch_size=args.batch_size)
+        print(f"{created} recurring invoices created")
+    elif args.command == "reconcile-client-stats":
+        fixed = await reconcile_client_stats(args.user_id)
+        print(f"{fixed} client counters corrected")
+    elif args.command == "rebuild-rollups":
+        rebuilt = await rebuild_revenue_rollups(args.user_id)
+        print(f"{rebuilt} revenue rollups rebuilt")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pilotage Micro maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("ensure-indexes", help="Create the declared MongoDB indexes")
+    explain_parser = subparsers.add_parser("explain", help="Report the query plan of each hot route")
+    explain_parser.add_argument("--user-id", default="00000000-0000-0000-0000-000000000000")
+    rollup_parser = subparsers.add_parser("rebuild-rollups", help="Recompute revenue rollups from paid invoices")
+    rollup_parser.add_argument("--user-id", default=None)
+    client_stats_parser = subparsers.add_parser("reconcile-client-stats", help="Recompute client invoice counters from invoices")
+    client_stats_parser.add_argument("--user-id", default=None)
+    reminders_parser = subparsers.add_parser("auto-reminders", help="Run one automatic reminder pass over all users")
+    reminders_parser.add_argument("--batch-size", type=int, default=AUTO_REMINDERS_BATCH_SIZE)
+    recurring_parser = subparsers.add_parser("recurring-invoices", help="Generate all due recurring invoices")
+    recurring_parser.add_argument("--batch-size", type=int, default=RECURRING_INVOICES_BATCH_SIZE)
+    subparsers.add_parser("run-workers", help="Run the periodic background workers in the foreground")
+    asyncio.run(_run_command(parser.parse_args()))
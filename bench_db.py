@@ -0,0 +1,45 @@
+"""
+Scratch database handling shared by the benchmark harnesses
+The harnesses seed and drop their database, so they never inherit a
+configured DB_NAME, only accept names containing 'bench' or 'test', and
+refuse a database that already exists.
+
+Call prepare_environment() before importing server.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+
+def prepare_environment(default_db_name: str):
+    """Force DB_NAME to the scratch default and make the backend importable"""
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ["DB_NAME"] = default_db_name
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def add_db_name_argument(parser, default_db_name: str):
+    parser.add_argument("--db-name", default=default_db_name, help="Scratch database, must contain 'bench' or 'test'")
+
+
+def check_db_name(parser, db_name: str):
+    if "bench" not in db_name.lower() and "test" not in db_name.lower():
+        parser.error("--db-name must contain 'bench' or 'test'")
+
+
+async def use_scratch_database(db_name: str):
+    """Point the app at a database that does not exist yet, so dropping it afterwards is safe"""
+    import server
+
+    if db_name in await server.client.list_database_names():
+        sys.exit(f"Database {db_name} already exists; pick another --db-name or drop it first")
+    server.db = server.client[db_name]
+
+
+async def drop_scratch_database(db_name: str):
+    import server
+
+    await server.client.drop_database(db_name)
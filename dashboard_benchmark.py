@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Dashboard revenue benchmark for Pilotage Micro
+Compares the three revenue strategies used by GET /api/dashboard
+("python-sum", "aggregate", "rollup") at 100, 10k and 100k paid invoices
+for a single user, against a local MongoDB.
+
+Usage: MONGO_URL=mongodb://localhost:27017 python dashboard_benchmark.py [--db-name pilotage_benchmark]
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import bench_db
+
+# Configuration
+DEFAULT_DB_NAME = "pilotage_benchmark"
+INVOICE_COUNTS = [100, 10_000, 100_000]
+REPEATS = 20
+
+bench_db.prepare_environment(DEFAULT_DB_NAME)
+import server  # noqa: E402
+
+PROFILE = {"micro_threshold": 77700.0, "vat_threshold": 36800.0}
+
+
+async def seed_user(invoice_count: int) -> str:
+    user_id = str(uuid.uuid4())
+    year_start = datetime(datetime.utcnow().year, 1, 1)
+    batch = []
+    for i in range(invoice_count):
+        amount = round(random.uniform(50, 2000), 2)
+        batch.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "invoice_number": server.format_invoice_number(year_start.year, i + 1),
+            "amount_ht": amount,
+            "vat_amount": 0.0,
+            "amount_ttc": amount,
+            "status": "paid",
+            "created_at": year_start,
+            "paid_at": year_start + timedelta(days=random.randint(0, 250)),
+            "description": "Prestation",
+            "client_name": "Client",
+            "client_email": "client@example.com",
+            "client_address": "1 rue de Paris",
+        })
+        if len(batch) == 5000:
+            await server.db.invoices.insert_many(batch)
+            batch = []
+    if batch:
+        await server.db.invoices.insert_many(batch)
+    await server.rebuild_revenue_rollups(user_id)
+    return user_id
+
+
+async def time_strategy(user_id: str, strategy: str) -> dict:
+    durations = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        summary = await server.compute_revenue_summary(user_id, PROFILE, strategy=strategy)
+        durations.append((time.perf_counter() - started) * 1000)
+    return {"total": summary["total"], "p50_ms": statistics.median(durations), "max_ms": max(durations)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dashboard revenue benchmark")
+    bench_db.add_db_name_argument(parser, DEFAULT_DB_NAME)
+    args = parser.parse_args()
+    bench_db.check_db_name(parser, args.db_name)
+    return args
+
+
+async def main():
+    args = parse_args()
+    # Only a database created here is dropped at the end
+    await bench_db.use_scratch_database(args.db_name)
+    await server.ensure_indexes()
+    print(f"{'invoices':>9} {'strategy':>11} {'p50 ms':>9} {'max ms':>9} {'total':>14}")
+    for invoice_count in INVOICE_COUNTS:
+        user_id = await seed_user(invoice_count)
+        for strategy in server.REVENUE_STRATEGIES:
+            result = await time_strategy(user_id, strategy)
+            print(f"{invoice_count:>9} {strategy:>11} {result['p50_ms']:>9.2f} {result['max_ms']:>9.2f} {result['total']:>14.2f}")
+    await bench_db.drop_scratch_database(args.db_name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
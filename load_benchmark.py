@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Load test and benchmark harness for Pilotage Micro
+Replays the backend_test.py flows (login, create invoice, dashboard, invoice
+list, PDF download, reminders) as concurrent async traffic against the
+FastAPI app running in-process, backed by a local MongoDB or by
+mongomock-motor (--mock-db). Seeds N users x M clients x K invoices,
+reports throughput and p50/p95/p99 per endpoint, and saves the results as
+JSON so runs can be compared with --baseline.
+
+Requires httpx (and mongomock-motor for --mock-db).
+Usage: python load_benchmark.py --users 20 --invoices 200 --concurrency 50 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import bench_db
+
+DEFAULT_DB_NAME = "pilotage_load_test"
+bench_db.prepare_environment(DEFAULT_DB_NAME)
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+TEST_USER_PASSWORD = "password123"
+
+# Scenario mix: (name, weight)
+SCENARIOS = [
+    ("dashboard", 30),
+    ("list_invoices", 25),
+    ("create_invoice", 15),
+    ("download_pdf", 10),
+    ("send_reminder", 10),
+    ("login", 10),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pilotage Micro load test")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=5, help="Clients per user")
+    parser.add_argument("--invoices", type=int, default=100, help="Invoices per user")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of traffic")
+    parser.add_argument("--mock-db", action="store_true", help="Use mongomock-motor instead of MongoDB")
+    bench_db.add_db_name_argument(parser, DEFAULT_DB_NAME)
+    parser.add_argument("--output", default="load_benchmark_results.json")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    args = parser.parse_args()
+    bench_db.check_db_name(parser, args.db_name)
+    return args
+
+
+def use_mock_database(db_name: str):
+    from mongomock_motor import AsyncMongoMockClient
+    server.client = AsyncMongoMockClient()
+    server.db = server.client[db_name]
+
+
+async def seed(users: int, clients: int, invoices: int) -> list:
+    """Insert users, profiles, clients and invoices directly; returns seeded users"""
+    # One bcrypt hash shared by every seeded user keeps seeding fast
+    password_hash = await server.password_hasher.hash(TEST_USER_PASSWORD)
+    now = datetime.utcnow()
+    seeded = []
+    for u in range(users):
+        user_id = str(uuid.uuid4())
+        email = f"load-{u}-{user_id[:8]}@test.com"
+        await server.db.users.insert_one({
+            "id": user_id, "email": email, "password": password_hash,
+            "first_name": "Load", "last_name": f"User{u}", "created_at": now, "is_onboarded": True,
+        })
+        await server.db.profiles.insert_one(server.UserProfile(
+            user_id=user_id, activity_type="BNC", urssaf_periodicity="monthly",
+            vat_regime="franchise", micro_threshold=77700.0, vat_threshold=36800.0,
+        ).model_dump())
+        client_docs = [
+            server.Client(user_id=user_id, name=f"Client {c}", email=f"client{c}@{user_id[:8]}.fr",
+                          address=f"{c} rue de Paris").model_dump()
+            for c in range(clients)
+        ]
+        if client_docs:
+            await server.db.clients.insert_many(client_docs)
+        invoice_docs = []
+        for i in range(invoices):
+            client = random.choice(client_docs) if client_docs else None
+            amount = round(random.uniform(100, 3000), 2)
+            status = random.choice(["draft", "sent", "paid", "overdue"])
+            invoice_docs.append(server.Invoice(
+                user_id=user_id,
+                client_id=client["id"] if client else None,
+                invoice_number=server.format_invoice_number(now.year, i + 1),
+                client_name=client["name"] if client else "Client",
+                client_email=client["email"] if client else "client@test.fr",
+                client_address=client["address"] if client else "Paris",
+                amount_ht=amount, amount_ttc=amount, description="Prestation",
+                status=status,
+                created_at=now - timedelta(days=random.randint(0, 200)),
+                due_date=now - timedelta(days=random.randint(-30, 60)),
+                paid_at=now - timedelta(days=random.randint(0, 100)) if status == "paid" else None,
+            ).model_dump())
+        if invoice_docs:
+            await server.db.invoices.insert_many(invoice_docs)
+        seeded.append({"email": email, "invoice_ids": [doc["id"] for doc in invoice_docs]})
+    await server.rebuild_revenue_rollups()
+    return seeded
+
+
+class LoadRunner:
+    def __init__(self, http: httpx.AsyncClient, users: list):
+        self.http = http
+        self.users = users
+        self.latencies = {name: [] for name, _ in SCENARIOS}
+        self.errors = {name: 0 for name, _ in SCENARIOS}
+        self.tokens = {}
+
+    async def login(self, user: dict) -> dict:
+        response = await self.http.post("/api/auth/login", json={"email": user["email"], "password": TEST_USER_PASSWORD})
+        response.raise_for_status()
+        self.tokens[user["email"]] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return self.tokens[user["email"]]
+
+    async def run_scenario(self, name: str, user: dict):
+        headers = self.tokens.get(user["email"])
+        if headers is None:
+            headers = await self.login(user)
+        if name == "login":
+            return await self.http.post("/api/auth/login", json={"email": user["email"], "password": TEST_USER_PASSWORD})
+        if name == "dashboard":
+            return await self.http.get("/api/dashboard", headers=headers)
+        if name == "list_invoices":
+            return await self.http.get("/api/invoices", params={"limit": 50}, headers=headers)
+        if name == "create_invoice":
+            response = await self.http.post("/api/invoices", headers=headers, json={
+                "client_name": "Entreprise XYZ", "client_email": "contact@xyz.fr",
+                "client_address": "1 rue de Paris", "amount_ht": 1200.0, "description": "Prestation",
+            })
+            if response.status_code < 400:
+                user["invoice_ids"].append(response.json()["id"])
+            return response
+        invoice_id = random.choice(user["invoice_ids"])
+        if name == "download_pdf":
+            return await self.http.get(f"/api/invoices/{invoice_id}/pdf", headers=headers)
+        return await self.http.post(f"/api/invoices/{invoice_id}/reminders", headers=headers)
+
+    async def worker(self, deadline: float):
+        names = [name for name, _ in SCENARIOS]
+        weights = [weight for _, weight in SCENARIOS]
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            user = random.choice(self.users)
+            started = time.perf_counter()
+            try:
+                response = await self.run_scenario(name, user)
+                # 400/409 from reminders on paid or in-flight invoices are expected
+                failed = response.status_code >= 500 or response.status_code == 429
+            except httpx.HTTPError:
+                failed = True
+            self.latencies[name].append((time.perf_counter() - started) * 1000)
+            self.errors[name] += failed
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(runner: LoadRunner, elapsed: float) -> dict:
+    endpoints = {}
+    for name, values in runner.latencies.items():
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": runner.errors[name],
+            "throughput_rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "p99_ms": percentile(values, 0.99),
+        }
+    total = sum(len(values) for values in runner.latencies.values())
+    return {"elapsed_seconds": elapsed, "total_requests": total, "throughput_rps": total / elapsed, "endpoints": endpoints}
+
+
+def print_report(results: dict, baseline: dict = None):
+    print(f"{'endpoint':>15} {'reqs':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in results["endpoints"].items():
+        line = (f"{name:>15} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8.1f} "
+                f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}")
+        previous = (baseline or {}).get("endpoints", {}).get(name)
+        if previous and previous["p95_ms"]:
+            line += f"  p95 {(stats['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}% vs baseline"
+        print(line)
+    print(f"\nTotal: {results['total_requests']} requests, {results['throughput_rps']:.1f} req/s")
+
+
+async def main():
+    args = parse_args()
+    if args.mock_db:
+        use_mock_database(args.db_name)
+    else:
+        await bench_db.use_scratch_database(args.db_name)
+    await server.ensure_indexes()
+    print(f"Seeding {args.users} users x {args.clients} clients x {args.invoices} invoices...")
+    users = await seed(args.users, args.clients, args.invoices)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as http:
+        runner = LoadRunner(http, users)
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(runner.worker(deadline) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    results = summarize(runner, elapsed)
+    results["config"] = vars(args)
+    results["timestamp"] = datetime.utcnow().isoformat()
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_report(results, baseline)
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"Results saved to {args.output}")
+
+    if not args.mock_db:
+        await bench_db.drop_scratch_database(args.db_name)
+    server.pdf_renderer.shutdown()
+    server.password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
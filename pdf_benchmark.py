@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Invoice PDF rendering micro-benchmark for Pilotage Micro
+Measures per-render time and allocated memory of generate_invoice_pdf with
+styles rebuilt on every call (previous behaviour) versus the shared
+precompiled InvoiceTemplate, for a single-line and a multi-page invoice.
+
+Usage: python pdf_benchmark.py
+"""
+
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Configuration
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pilotage_benchmark")
+RENDERS = 200
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+import server  # noqa: E402
+
+PROFILE = {"activity_type": "BNC", "vat_regime": "franchise"}
+USER = {"first_name": "Marie", "last_name": "Dupont", "email": "marie@test.com"}
+
+
+def make_invoice(line_count: int) -> server.Invoice:
+    lines = [
+        server.InvoiceLine(description=f"Prestation de conseil, lot {i + 1}", quantity=1, unit_price_ht=100.0)
+        for i in range(line_count)
+    ]
+    amount_ht = 100.0 * max(line_count, 1)
+    return server.Invoice(
+        user_id="benchmark",
+        invoice_number="FAC-2025-0001",
+        client_name="Entreprise XYZ",
+        client_email="contact@xyz.fr",
+        client_address="1 rue de Paris, 75001 Paris",
+        amount_ht=amount_ht,
+        amount_ttc=amount_ht,
+        description="Prestation de conseil",
+        lines=lines,
+    )
+
+
+def measure(invoice: server.Invoice, rebuild_styles: bool) -> dict:
+    durations = []
+    tracemalloc.start()
+    for _ in range(RENDERS):
+        started = time.perf_counter()
+        template = server.InvoiceTemplate() if rebuild_styles else None
+        server.generate_invoice_pdf(invoice, PROFILE, USER, template=template)
+        durations.append((time.perf_counter() - started) * 1000)
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size for stat in snapshot.statistics("filename"))
+    return {
+        "p50_ms": statistics.median(durations),
+        "mean_ms": statistics.mean(durations),
+        "peak_kib": peak / 1024,
+        "retained_kib": allocated / 1024,
+    }
+
+
+def main():
+    print(f"{'invoice':>10} {'styles':>9} {'p50 ms':>8} {'mean ms':>8} {'peak KiB':>9} {'retained KiB':>13}")
+    for label, line_count in (("1 line", 0), ("120 lines", 120)):
+        invoice = make_invoice(line_count)
+        for mode, rebuild in (("rebuilt", True), ("shared", False)):
+            result = measure(invoice, rebuild)
+            print(f"{label:>10} {mode:>9} {result['p50_ms']:>8.2f} {result['mean_ms']:>8.2f} "
+                  f"{result['peak_kib']:>9.1f} {result['retained_kib']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
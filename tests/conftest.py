@@ -0,0 +1,73 @@
+"""
+Shared fixtures: the backend module backed by mongomock-motor, and an HTTP
+client bound to the app in-process
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pilotage_test")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+mongomock_motor = pytest.importorskip("mongomock_motor")
+httpx = pytest.importorskip("httpx")
+import server  # noqa: E402
+
+PROFILE = {
+    "activity_type": "BNC",
+    "urssaf_periodicity": "monthly",
+    "vat_regime": "franchise",
+    "micro_threshold": 77700.0,
+    "vat_threshold": 36800.0,
+}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock_motor.AsyncMongoMockClient()["pilotage_test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "profile_cache", server.ProfileCache(100, 30))
+    return database
+
+
+@pytest.fixture
+async def api(db):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def register(api, email: str = "marie@test.com", password: str = "password123", profile: bool = True) -> dict:
+    """Register a user (and by default their profile); returns auth headers"""
+    response = await api.post("/api/auth/register", json={
+        "email": email, "password": password, "first_name": "Marie", "last_name": "Dupont",
+    })
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    if profile:
+        (await api.post("/api/profile", json=PROFILE, headers=headers)).raise_for_status()
+    return headers
+
+
+@pytest.fixture
+async def auth(api):
+    return await register(api)
+
+
+@pytest.fixture
+def renders(monkeypatch, tmp_path):
+    """Count renders and cache to a temporary directory that does not exist yet"""
+    rendered = []
+
+    async def fake_render(invoice, user_profile, user_info):
+        rendered.append(invoice.invoice_number)
+        return f"%PDF {invoice.invoice_number} {user_profile['activity_type']}".encode()
+
+    monkeypatch.setattr(server, "render_invoice_pdf", fake_render)
+    monkeypatch.setattr(server, "pdf_store", server.DiskPdfStore(tmp_path / "pdf_cache", 10_000))
+    return rendered
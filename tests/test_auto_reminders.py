@@ -0,0 +1,47 @@
+"""
+Automatic reminder pass, run against mongomock-motor
+"""
+
+from datetime import datetime, timedelta
+
+import server
+
+
+def make_invoice(invoice_id: str, days_overdue: int, **fields) -> dict:
+    now = datetime.utcnow()
+    return server.Invoice(
+        id=invoice_id,
+        user_id="user-1",
+        invoice_number=f"FAC-{now.year}-0001",
+        client_name="Entreprise XYZ",
+        client_email="contact@xyz.fr",
+        client_address="1 rue de Paris",
+        amount_ht=1000.0,
+        amount_ttc=1000.0,
+        description="Prestation",
+        status="sent",
+        due_date=now - timedelta(days=days_overdue),
+        **fields,
+    ).model_dump()
+
+
+async def test_overdue_invoice_gets_one_reminder(db):
+    await db.invoices.insert_one(make_invoice("i1", days_overdue=10))
+
+    assert await server.run_auto_reminders() == 1
+    invoice = await db.invoices.find_one({"id": "i1"})
+    reminders = await db.reminders.find({}).to_list(10)
+    outbox = await db.outbox.find({}).to_list(10)
+    assert invoice["reminder_count"] == 1
+    assert invoice["status"] == "overdue"
+    assert [(r["id"], r["type"]) for r in reminders] == [("i1-1", "gentle")]
+    assert [m["to"] for m in outbox] == ["contact@xyz.fr"]
+
+
+async def test_invoice_moves_one_cohort_per_pass(db):
+    await db.invoices.insert_one(make_invoice("i1", days_overdue=20))
+
+    assert await server.run_auto_reminders() == 1
+    assert await server.run_auto_reminders() == 1
+    reminders = await db.reminders.find({}, {"_id": 0, "id": 1, "type": 1}).sort("id", 1).to_list(10)
+    assert [(r["id"], r["type"]) for r in reminders] == [("i1-1", "gentle"), ("i1-2", "firm")]
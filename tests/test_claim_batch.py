@@ -0,0 +1,32 @@
+"""
+Lease-based batch claiming shared by the outbox and notification workers
+"""
+
+from datetime import datetime, timedelta
+
+import server
+
+QUEUED = {"status": "queued"}
+
+
+async def test_claimed_documents_are_not_handed_out_twice(db):
+    await db.jobs.insert_many([{"id": f"job-{i}", "status": "queued", "rank": i} for i in range(5)])
+
+    first = await server.claim_batch(db.jobs, QUEUED, [("rank", 1)], 3, lease_seconds=60)
+    second = await server.claim_batch(db.jobs, QUEUED, [("rank", 1)], 3, lease_seconds=60)
+    assert [job["id"] for job in first] == ["job-0", "job-1", "job-2"]
+    assert [job["id"] for job in second] == ["job-3", "job-4"]
+    assert first[0]["lease_token"] != second[0]["lease_token"]
+    assert await server.claim_batch(db.jobs, QUEUED, [("rank", 1)], 3, lease_seconds=60) == []
+
+
+async def test_expired_lease_is_reclaimed(db):
+    await db.jobs.insert_one({"id": "job-0", "status": "queued", "rank": 0})
+    first = await server.claim_batch(db.jobs, QUEUED, [("rank", 1)], 10, lease_seconds=60)
+
+    # The worker holding the lease died; once it expires another one takes over
+    await db.jobs.update_one({"id": "job-0"}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+    reclaimed = await server.claim_batch(db.jobs, QUEUED, [("rank", 1)], 10, lease_seconds=60)
+    assert [job["id"] for job in reclaimed] == ["job-0"]
+    assert reclaimed[0]["lease_token"] != first[0]["lease_token"]
+    assert reclaimed[0]["lease_until"] > datetime.utcnow()
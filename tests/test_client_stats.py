@@ -0,0 +1,44 @@
+"""
+Client invoice counters and the startup backfill
+"""
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def fresh_migration_state(monkeypatch):
+    monkeypatch.setattr(server, "client_stats_ready", False)
+
+
+def legacy_client(client_id: str) -> dict:
+    # Counters stayed at 0 before they were maintained
+    return server.Client(id=client_id, user_id="user-1", name=client_id, email=f"{client_id}@xyz.fr", address="Paris").model_dump()
+
+
+async def test_delete_counts_invoices_until_backfill_ran(db):
+    await db.clients.insert_one(legacy_client("c1"))
+    await db.invoices.insert_one({"id": "i1", "user_id": "user-1", "client_id": "c1", "status": "sent", "amount_ttc": 100.0})
+
+    with pytest.raises(HTTPException) as refused:
+        await server.delete_client("c1", user_id="user-1")
+    assert refused.value.status_code == 400
+    assert await db.clients.count_documents({"id": "c1"}) == 1
+
+
+async def test_backfill_fixes_counters_and_enables_counter_checks(db):
+    await db.clients.insert_many([legacy_client("c1"), legacy_client("c2")])
+    await db.invoices.insert_many([
+        {"id": "i1", "user_id": "user-1", "client_id": "c1", "status": "paid", "amount_ttc": 120.0},
+        {"id": "i2", "user_id": "user-1", "client_id": "c1", "status": "sent", "amount_ttc": 80.0},
+    ])
+
+    assert await server.reconcile_client_stats() == 1
+    c1 = await db.clients.find_one({"id": "c1"})
+    assert (c1["total_invoices"], c1["total_amount"]) == (2, 120.0)
+    assert await server.client_stats_backfilled()
+    with pytest.raises(HTTPException):
+        await server.delete_client("c1", user_id="user-1")
+    assert await server.delete_client("c2", user_id="user-1") == {"message": "Client supprimé"}
@@ -0,0 +1,34 @@
+"""
+Dashboard revenue strategies agree on the same invoices
+"""
+
+from datetime import datetime
+
+import pytest
+
+import server
+from tests.test_revenue_rollups import PROFILE, YEAR, paid_invoice
+
+
+@pytest.mark.parametrize("strategy", list(server.REVENUE_STRATEGIES))
+async def test_strategies_agree(db, strategy):
+    await db.invoices.insert_many([
+        paid_invoice("0001", 1000.0, datetime(YEAR, 1, 15)),
+        paid_invoice("0002", 500.0, datetime(YEAR, 1, 20)),
+        paid_invoice("0003", 250.0, datetime(YEAR, 4, 2)),
+        paid_invoice("0004", 9999.0, datetime(YEAR - 1, 12, 31)),  # Previous year
+        {**paid_invoice("0005", 700.0, datetime(YEAR, 5, 1)), "status": "sent"},
+        {**paid_invoice("0006", 300.0, datetime(YEAR, 5, 1)), "user_id": "user-2"},
+    ])
+
+    summary = await server.compute_revenue_summary("user-1", PROFILE, YEAR, strategy=strategy)
+    assert summary["total"] == 1750.0
+    assert summary["months"] == {"01": 1500.0, "04": 250.0}
+    assert summary["micro_threshold_percent"] == pytest.approx(1750.0 / 77700.0 * 100)
+    assert summary["vat_threshold_percent"] == pytest.approx(1750.0 / 36800.0 * 100)
+
+
+@pytest.mark.parametrize("strategy", list(server.REVENUE_STRATEGIES))
+async def test_strategies_agree_without_paid_invoices(db, strategy):
+    summary = await server.compute_revenue_summary("user-1", PROFILE, YEAR, strategy=strategy)
+    assert (summary["total"], summary["months"], summary["micro_threshold_percent"]) == (0.0, {}, 0.0)
@@ -0,0 +1,37 @@
+"""
+Index provisioning against a database holding legacy duplicates
+"""
+
+import asyncio
+
+import server
+
+
+async def test_blocked_unique_index_does_not_stop_the_others(db):
+    await db.invoices.insert_many([
+        {"id": "a", "user_id": "user-1", "invoice_number": "FAC-2025-0001"},
+        {"id": "b", "user_id": "user-1", "invoice_number": "FAC-2025-0001"},
+    ])
+
+    result = await server.ensure_indexes()
+    assert list(result["failed"]) == ["invoices"]
+    assert result["failed"]["invoices"][0].startswith("user_invoice_number_unique")
+    assert "user_id_id" in result["created"]["invoices"]
+    assert "id_unique" in await db.reminders.index_information()
+    assert {"user_key_unique", "read_ttl"} <= set(await db.notifications.index_information())
+
+
+async def test_concurrent_duplicates_get_the_precheck_error(db, api):
+    await server.ensure_indexes()
+    payload = {"email": "marie@test.com", "password": "password123", "first_name": "Marie", "last_name": "Dupont"}
+
+    # Both requests pass the find_one check before either inserts
+    responses = await asyncio.gather(*(api.post("/api/auth/register", json=payload) for _ in range(2)))
+    assert sorted(r.status_code for r in responses) == [200, 400]
+    assert [r.json()["detail"] for r in responses if r.status_code == 400] == ["Email déjà utilisé"]
+
+    headers = {"Authorization": f"Bearer {next(r for r in responses if r.status_code == 200).json()['access_token']}"}
+    client = {"name": "Entreprise XYZ", "email": "contact@xyz.fr", "address": "1 rue de Paris"}
+    responses = await asyncio.gather(*(api.post("/api/clients", json=client, headers=headers) for _ in range(2)))
+    assert sorted(r.status_code for r in responses) == [200, 400]
+    assert [r.json()["detail"] for r in responses if r.status_code == 400] == ["Un client avec cet email existe déjà"]
@@ -0,0 +1,54 @@
+"""
+Streaming ZIP export of invoice PDFs
+"""
+
+import io
+import zipfile
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+import server
+from tests.test_invoices import INVOICE
+
+
+async def create_invoices(api, auth, count: int) -> list:
+    """Create invoices a minute apart, oldest first; returns their ids and numbers"""
+    invoices = []
+    for i in range(count):
+        invoice = (await api.post("/api/invoices", json={**INVOICE, "amount_ht": 100.0 + i}, headers=auth)).json()
+        created_at = datetime(2025, 3, 1) + timedelta(minutes=i)
+        await server.db.invoices.update_one({"id": invoice["id"]}, {"$set": {"created_at": created_at}})
+        invoices.append((invoice["id"], invoice["invoice_number"]))
+    return invoices
+
+
+async def test_export_streams_filtered_invoices_newest_first(api, auth, renders):
+    invoices = await create_invoices(api, auth, 5)
+    await api.put(f"/api/invoices/{invoices[0][0]}/status", params={"status": "paid"}, headers=auth)
+    numbers = [number for _, number in invoices]
+
+    response = await api.post("/api/invoices/export", json={"status": "draft"}, headers=auth)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.namelist() == [f"facture_{number}.pdf" for number in reversed(numbers[1:])]
+    assert archive.read(f"facture_{numbers[1]}.pdf") == f"%PDF {numbers[1]} BNC".encode()
+
+
+async def test_export_waits_out_a_saturated_pool(api, auth, monkeypatch, renders):
+    numbers = [number for _, number in await create_invoices(api, auth, 2)]
+    render = server.render_invoice_pdf
+    rejected = []
+
+    async def saturated_once(invoice, user_profile, user_info):
+        if not rejected:
+            rejected.append(invoice.invoice_number)
+            raise HTTPException(status_code=429, detail="Trop de PDF en cours de génération, réessayez plus tard")
+        return await render(invoice, user_profile, user_info)
+
+    monkeypatch.setattr(server, "render_invoice_pdf", saturated_once)
+    response = await api.post("/api/invoices/export", json={}, headers=auth)
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert len(rejected) == 1
+    assert archive.namelist() == [f"facture_{number}.pdf" for number in reversed(numbers)]
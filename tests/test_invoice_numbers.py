@@ -0,0 +1,33 @@
+"""
+Invoice numbering on top of numbers issued before counters existed
+"""
+
+from datetime import datetime
+
+import server
+
+
+async def test_counter_seeds_from_the_numerically_highest_number(db):
+    year = datetime.now().year
+    await db.invoices.insert_many([
+        {"user_id": "user-1", "invoice_number": server.format_invoice_number(year, 9999)},
+        {"user_id": "user-1", "invoice_number": server.format_invoice_number(year, 10000)},
+    ])
+
+    assert await server.reserve_invoice_numbers("user-1", count=2) == [f"FAC-{year}-10001", f"FAC-{year}-10002"]
+
+
+async def test_create_invoice_recovers_from_a_stale_counter(db):
+    year = datetime.now().year
+    ctx = server.RequestContext("user-1")
+    ctx._profile, ctx._loaded = {"user_id": "user-1", "vat_regime": "franchise"}, True
+    invoice_data = server.InvoiceCreate(
+        client_name="Entreprise XYZ", client_email="contact@xyz.fr",
+        client_address="1 rue de Paris", amount_ht=100.0, description="Prestation",
+    )
+    await server.ensure_indexes()
+    await db.invoice_counters.insert_one({"_id": f"user-1:{year}", "user_id": "user-1", "year": year, "seq": 1})
+    await db.invoices.insert_one({"id": "legacy", "user_id": "user-1", "invoice_number": server.format_invoice_number(year, 2)})
+
+    invoice = await server.create_invoice(invoice_data, ctx)
+    assert invoice.invoice_number == f"FAC-{year}-0003"
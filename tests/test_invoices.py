@@ -0,0 +1,81 @@
+"""
+Invoice creation, single and batched
+"""
+
+from datetime import datetime
+
+import server
+
+INVOICE = {
+    "client_name": "Entreprise XYZ", "client_email": "contact@xyz.fr", "client_address": "1 rue de Paris",
+    "description": "Prestation",
+}
+LINES = [
+    {"description": "Conseil", "quantity": 3, "unit_price_ht": 100.0},
+    {"description": "Frais", "quantity": 1, "unit_price_ht": 20.5},
+]
+
+
+async def test_amount_ht_is_computed_from_lines(api, auth):
+    response = await api.post("/api/invoices", json={**INVOICE, "lines": LINES}, headers=auth)
+
+    assert response.status_code == 200
+    assert response.json()["amount_ht"] == 320.5
+    assert response.json()["amount_ttc"] == 320.5  # Franchise en base de TVA
+
+
+async def test_matching_amount_ht_is_accepted(api, auth):
+    response = await api.post("/api/invoices", json={**INVOICE, "amount_ht": 320.5, "lines": LINES}, headers=auth)
+    assert response.status_code == 200
+
+
+async def test_amount_ht_contradicting_lines_is_rejected(api, auth, db):
+    response = await api.post("/api/invoices", json={**INVOICE, "amount_ht": 1000.0, "lines": LINES}, headers=auth)
+
+    assert response.status_code == 422
+    assert "ne correspond pas au total des lignes (320.50)" in response.json()["detail"][0]["msg"]
+    assert await db.invoices.count_documents({}) == 0
+
+
+async def test_amount_or_lines_are_required(api, auth):
+    response = await api.post("/api/invoices", json=INVOICE, headers=auth)
+
+    assert response.status_code == 422
+    assert "Montant HT ou lignes de détail requis" in response.json()["detail"][0]["msg"]
+
+
+async def test_batch_reports_each_item_and_stops_at_a_number_collision(api, auth, db):
+    year = datetime.now().year
+    await server.ensure_indexes()
+    user_id = (await db.users.find_one({}))["id"]
+    # Stale counter: the second reserved number is already taken
+    await db.invoice_counters.insert_one({"_id": f"{user_id}:{year}", "user_id": user_id, "year": year, "seq": 0})
+    await db.invoices.insert_one({"id": "legacy", "user_id": user_id, "invoice_number": server.format_invoice_number(year, 2)})
+
+    response = await api.post("/api/invoices:batch", json=[
+        {**INVOICE, "amount_ht": 100.0},
+        {"client_name": "Sans email"},
+        {**INVOICE, "amount_ht": 200.0},
+        {**INVOICE, "amount_ht": 999.0, "lines": LINES},
+        {**INVOICE, "amount_ht": 300.0},
+    ], headers=auth)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["created", "error", "error", "error", "skipped"]
+    assert results[0]["invoice"]["invoice_number"] == f"FAC-{year}-0001"
+    assert {error["loc"][0] for error in results[1]["detail"]} == {"client_email", "client_address", "description"}
+    assert "E11000" in results[2]["detail"]
+    assert "ne correspond pas au total des lignes" in results[3]["detail"][0]["msg"]
+    assert response.json()["message"] == "1 facture(s) créée(s)"
+
+    # The counter is past the legacy number; 0003 went to the skipped item
+    retry = await api.post("/api/invoices", json={**INVOICE, "amount_ht": 300.0}, headers=auth)
+    assert retry.json()["invoice_number"] == f"FAC-{year}-0004"
+
+
+async def test_batch_size_is_bounded(api, auth):
+    assert (await api.post("/api/invoices:batch", json=[], headers=auth)).json()["detail"] == "Aucune facture à créer"
+    too_many = [{**INVOICE, "amount_ht": 1.0}] * (server.MAX_INVOICE_BATCH + 1)
+    response = await api.post("/api/invoices:batch", json=too_many, headers=auth)
+    assert (response.status_code, response.json()["detail"]) == (400, "Maximum 500 factures par lot")
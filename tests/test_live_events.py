@@ -0,0 +1,66 @@
+"""
+Server-Sent Events stream fed by the in-process event bus
+"""
+
+import json
+
+import jwt
+import pytest
+
+import server
+from tests.test_invoices import INVOICE
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+
+def parse_event(chunk: str) -> tuple:
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+
+@pytest.fixture
+def live_events(monkeypatch):
+    bus = server.EventBus(queue_size=10)
+    monkeypatch.setattr(server, "live_events", bus)
+    return bus
+
+
+async def test_stream_sends_state_then_pushed_updates(api, auth, live_events, monkeypatch):
+    user_id = jwt.decode(auth["Authorization"].split()[1], server.JWT_SECRET, algorithms=[server.JWT_ALGORITHM])["user_id"]
+    invoice_id = (await api.post("/api/invoices", json={**INVOICE, "amount_ht": 1200.0}, headers=auth)).json()["id"]
+    request = FakeRequest()
+    stream = server._event_stream(request, user_id)
+
+    assert parse_event(await anext(stream)) == ("dashboard", {
+        "current_revenue": 0.0, "monthly_revenue": {}, "micro_threshold_percent": 0.0, "vat_threshold_percent": 0.0,
+    })
+    assert parse_event(await anext(stream)) == ("unread", {"unread": 0})
+
+    await api.put(f"/api/invoices/{invoice_id}/status", params={"status": "paid"}, headers=auth)
+    assert parse_event(await anext(stream)) == ("invoice", {"id": invoice_id, "status": "paid"})
+    event, snapshot = parse_event(await anext(stream))
+    assert (event, snapshot["current_revenue"]) == ("dashboard", 1200.0)
+
+    monkeypatch.setattr(server, "LIVE_EVENTS_HEARTBEAT_SECONDS", 0.01)
+    assert await anext(stream) == ": keepalive\n\n"
+
+    request.disconnected = True
+    with pytest.raises(StopAsyncIteration):
+        await anext(stream)
+    assert not live_events.has_subscribers(user_id)
+
+
+async def test_slow_subscriber_drops_its_oldest_events(live_events):
+    queue = live_events.subscribe("user-1")
+    for unread in range(12):
+        live_events.publish("user-1", "unread", {"unread": unread})
+
+    assert queue.qsize() == 10
+    assert queue.get_nowait()["data"] == {"unread": 2}
+    assert live_events.stats()["dropped"] == 2
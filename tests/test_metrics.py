@@ -0,0 +1,29 @@
+"""
+Prometheus metrics: series stay bounded whatever clients send
+"""
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def request_metrics(monkeypatch):
+    metrics = server.RequestMetrics()
+    monkeypatch.setattr(server, "request_metrics", metrics)
+    return metrics
+
+
+async def test_labels_do_not_grow_with_ids_paths_or_methods(api, auth, request_metrics):
+    for i in range(20):
+        await api.get(f"/api/invoices/missing-{i}/reminders", headers=auth)
+        await api.get(f"/api/no-such-route-{i}")
+        await api.request(f"BREW{i}", "/api/invoices")
+
+    assert sorted(request_metrics.latency) == [
+        ("GET", "/api/invoices/{invoice_id}/reminders"), ("GET", "unmatched"), ("other", "/api/invoices"),
+    ]
+
+    body = (await api.get("/metrics")).text
+    assert 'http_responses_total{method="other",route="/api/invoices",status="405"} 20' in body
+    assert 'http_responses_total{method="GET",route="unmatched",status="404"} 20' in body
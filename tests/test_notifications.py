@@ -0,0 +1,64 @@
+"""
+Notification delivery, unread counters and scheduling
+"""
+
+from datetime import datetime, timedelta
+
+import server
+
+
+def make_notification(notification_id: str, scheduled_in: timedelta, user_id: str = "user-1") -> dict:
+    return server.Notification(
+        id=notification_id, user_id=user_id, type="urssaf", title="Déclaration URSSAF",
+        message="Pensez à déclarer", scheduled_date=datetime.utcnow() + scheduled_in,
+    ).model_dump()
+
+
+async def test_due_notifications_are_delivered_once(db, monkeypatch):
+    await db.notifications.insert_many([
+        make_notification("due-1", timedelta(hours=-2)),
+        make_notification("due-2", timedelta(hours=-1)),
+        make_notification("later", timedelta(days=1)),
+    ])
+    # due-2 fails to dispatch and stays leased until the lease expires
+    monkeypatch.setattr(server, "dispatch_notifications", lambda batch: [n["id"] for n in batch if n["id"] != "due-2"])
+
+    assert await server.deliver_due_notifications(batch_size=10) == 2
+    assert await server.deliver_due_notifications(batch_size=10) == 0
+    sent = {n["id"]: n["sent_date"] for n in await db.notifications.find({}).to_list(10)}
+    assert sent["due-1"] is not None
+    assert sent["due-2"] is None and sent["later"] is None
+
+
+async def test_first_adjustment_creates_counter_from_notifications(db):
+    # Inserted before any counter exists: the $inc alone would be lost
+    await db.notifications.insert_many([
+        make_notification("n1", timedelta(hours=-1)),
+        make_notification("n2", timedelta(hours=-1)),
+    ])
+    await server.adjust_unread_count("user-1", 2)
+
+    assert (await db.notification_counters.find_one({"_id": "user-1"}))["unread"] == 2
+    await server.adjust_unread_count("user-1", -1)
+    assert await server.get_unread_count("user-1") == 1
+
+
+async def test_negative_counter_is_recounted(db):
+    await db.notifications.insert_one(make_notification("n1", timedelta(hours=-1)))
+    await db.notification_counters.insert_one({"_id": "user-1", "unread": -2})
+
+    assert await server.get_unread_count("user-1") == 1
+    assert (await db.notification_counters.find_one({"_id": "user-1"}))["unread"] == 1
+
+
+async def test_rescheduling_a_period_creates_nothing_new(api, auth, db):
+    await server.ensure_indexes()
+
+    first = await api.post("/api/mock/schedule-notifications", headers=auth)
+    second = await api.post("/api/mock/schedule-notifications", headers=auth)
+
+    assert first.json()["message"] == "3 notifications programmées"
+    assert second.json()["message"] == "0 notifications programmées"
+    keys = [n["key"] for n in await db.notifications.find({}).to_list(10)]
+    assert len(keys) == len(set(keys)) == 3
+    assert (await api.get("/api/notifications/unread-count", headers=auth)).json() == {"unread": 3}
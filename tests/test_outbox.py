@@ -0,0 +1,67 @@
+"""
+Outbox delivery against a local aiosmtpd server
+"""
+
+import socket
+
+import pytest
+
+import server
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class RecipientHandler:
+    """Accepts mail except for mailbox-unknown (550) and busy (451) recipients"""
+
+    def __init__(self):
+        self.delivered = []
+
+    async def handle_RCPT(self, server_, session, envelope, address, rcpt_options):
+        if address.startswith("unknown@"):
+            return "550 5.1.1 Mailbox unknown"
+        if address.startswith("busy@"):
+            return "451 4.3.0 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server_, session, envelope):
+        self.delivered.extend(envelope.rcpt_tos)
+        return "250 Message accepted"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    handler = RecipientHandler()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    monkeypatch.setattr(server, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(server, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(server, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(server, "SMTP_USERNAME", None)
+    yield handler
+    controller.stop()
+
+
+async def test_permanent_refusals_fail_at_once_and_transient_ones_retry(db, smtp_server):
+    await server.enqueue_emails([
+        server.outbox_message("m1", "marie@test.com", "Relance", "Bonjour"),
+        server.outbox_message("m2", "unknown@test.com", "Relance", "Bonjour"),
+        server.outbox_message("m3", "busy@test.com", "Relance", "Bonjour"),
+    ])
+    sender = server.OutboxSender(pool_size=1)
+
+    assert await sender.send_pending() == 3
+    sender.pool.close()
+    messages = {m["id"]: m for m in await db.outbox.find({}).to_list(10)}
+    assert smtp_server.delivered == ["marie@test.com"]
+    assert messages["m1"]["status"] == "sent"
+    assert (messages["m2"]["status"], messages["m2"]["attempts"]) == ("failed", 1)
+    assert (messages["m3"]["status"], messages["m3"]["attempts"]) == ("pending", 1)
+    assert sender.stats()["failed"] == 1
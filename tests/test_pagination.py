@@ -0,0 +1,47 @@
+"""
+Keyset pagination of the client and invoice lists
+"""
+
+import pytest
+
+
+async def collect_pages(api, path: str, headers: dict, limit: int, **extra) -> list:
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **extra, **({"cursor": cursor} if cursor else {})}
+        response = await api.get(path, params=params, headers=headers)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+async def test_clients_are_paged_by_name(api, auth):
+    for name in ["Delta", "Alpha", "Echo", "Charlie", "Bravo"]:
+        (await api.post("/api/clients", json={"name": name, "email": f"{name.lower()}@test.fr", "address": "Paris"}, headers=auth)).raise_for_status()
+
+    pages = await collect_pages(api, "/api/clients", auth, limit=2)
+    assert [[c["name"] for c in page] for page in pages] == [["Alpha", "Bravo"], ["Charlie", "Delta"], ["Echo"]]
+
+
+async def test_invoices_are_paged_newest_first_with_projection(api, auth):
+    for i in range(3):
+        (await api.post("/api/invoices", json={
+            "client_name": f"Client {i}", "client_email": "client@test.fr", "client_address": "Paris",
+            "amount_ht": 100.0, "description": "Prestation",
+        }, headers=auth)).raise_for_status()
+
+    pages = await collect_pages(api, "/api/invoices", auth, limit=2, fields="invoice_number")
+    numbers = [invoice["invoice_number"] for page in pages for invoice in page]
+    assert len(pages) == 2
+    assert numbers == sorted(numbers, reverse=True)
+    assert set(pages[0][0]) == {"id", "created_at", "invoice_number"}
+
+
+@pytest.mark.parametrize("cursor", ["e30=", "WzFd", "bm90LWpzb24=", "%%%", "eyJuYW1lIjogWzFdLCAiaWQiOiAiYSJ9"])
+@pytest.mark.parametrize("path", ["/api/clients", "/api/invoices", "/api/notifications"])
+async def test_malformed_cursor_is_rejected(api, auth, path, cursor):
+    response = await api.get(path, params={"cursor": cursor}, headers=auth)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Curseur invalide"
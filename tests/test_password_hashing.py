@@ -0,0 +1,22 @@
+"""
+Password hashing pool and rehash-on-login
+"""
+
+import server
+from tests.conftest import register
+
+
+async def test_login_verifies_off_the_event_loop_and_upgrades_the_work_factor(api, db, monkeypatch):
+    await register(api, profile=False)
+    stored = (await db.users.find_one({"email": "marie@test.com"}))["password"]
+    assert stored.split("$")[2] == f"{server.password_hasher.rounds:02d}"
+
+    monkeypatch.setattr(server.password_hasher, "rounds", server.password_hasher.rounds + 1)
+    response = await api.post("/api/auth/login", json={"email": "marie@test.com", "password": "password123"})
+    assert response.status_code == 200
+    upgraded = (await db.users.find_one({"email": "marie@test.com"}))["password"]
+    assert upgraded.split("$")[2] == f"{server.password_hasher.rounds:02d}"
+
+    wrong = await api.post("/api/auth/login", json={"email": "marie@test.com", "password": "nope"})
+    assert wrong.status_code == 400
+    assert server.password_hasher.stats()["in_flight"] == 0
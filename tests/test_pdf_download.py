@@ -0,0 +1,69 @@
+"""
+Invoice PDF download: ETag revalidation and the rendered PDF cache
+"""
+
+import pytest
+
+import server
+from tests.conftest import PROFILE
+
+INVOICE = {
+    "client_name": "Entreprise XYZ", "client_email": "contact@xyz.fr", "client_address": "1 rue de Paris",
+    "amount_ht": 300.0, "description": "Prestation",
+    "lines": [{"description": "Conseil", "quantity": 3, "unit_price_ht": 100.0}],
+}
+
+
+@pytest.fixture
+async def invoice_id(api, auth):
+    response = await api.post("/api/invoices", json=INVOICE, headers=auth)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+@pytest.mark.parametrize("if_none_match", [
+    "{etag}", "W/{etag}", '"other", {etag}', "*",
+])
+async def test_matching_etag_gets_304(api, auth, renders, invoice_id, if_none_match):
+    first = await api.get(f"/api/invoices/{invoice_id}/pdf", headers=auth)
+    etag = first.headers["ETag"]
+
+    response = await api.get(
+        f"/api/invoices/{invoice_id}/pdf", headers={**auth, "If-None-Match": if_none_match.format(etag=etag)}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert len(renders) == 1
+
+
+async def test_other_etag_gets_the_pdf_from_cache(api, auth, renders, invoice_id):
+    first = await api.get(f"/api/invoices/{invoice_id}/pdf", headers=auth)
+    second = await api.get(f"/api/invoices/{invoice_id}/pdf", headers={**auth, "If-None-Match": '"stale"'})
+
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert len(renders) == 1
+
+
+async def test_profile_or_lines_change_invalidates_the_pdf(api, auth, db, renders, invoice_id):
+    first = await api.get(f"/api/invoices/{invoice_id}/pdf", headers=auth)
+
+    (await api.put("/api/profile", json={**PROFILE, "activity_type": "BIC"}, headers=auth)).raise_for_status()
+    after_profile = await api.get(f"/api/invoices/{invoice_id}/pdf", headers={**auth, "If-None-Match": first.headers["ETag"]})
+    assert after_profile.status_code == 200
+    assert after_profile.content.endswith(b"BIC")
+
+    await db.invoices.update_one({"id": invoice_id}, {"$push": {"lines": {"description": "Frais", "quantity": 1, "unit_price_ht": 50.0}}})
+    after_lines = await api.get(f"/api/invoices/{invoice_id}/pdf", headers={**auth, "If-None-Match": after_profile.headers["ETag"]})
+    assert after_lines.status_code == 200
+    assert len({first.headers["ETag"], after_profile.headers["ETag"], after_lines.headers["ETag"]}) == 3
+    assert len(renders) == 3
+
+
+async def test_export_does_not_fill_the_cache(api, auth, renders, invoice_id):
+    response = await api.post("/api/invoices/export", json={}, headers=auth)
+
+    assert response.status_code == 200
+    assert len(renders) == 1
+    assert server.pdf_store.total_bytes == 0
+    assert not server.pdf_store.directory.exists()
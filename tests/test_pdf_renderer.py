@@ -0,0 +1,41 @@
+"""
+PDF rendering pool: spawned workers, timeouts and queue wait
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+from tests.test_auto_reminders import make_invoice
+
+USER = {"first_name": "Marie", "last_name": "Dupont", "email": "marie@test.com"}
+
+
+def slow_render(invoice, profile, user):
+    time.sleep(0.2)
+    return b"%PDF-slow"
+
+
+async def test_renders_in_a_spawned_worker():
+    renderer = server.PdfRenderer(workers=1, timeout=60, max_queue=4)
+    try:
+        pdf = await renderer.render(server.Invoice(**make_invoice("i1", 0)), {"activity_type": "BNC"}, USER)
+    finally:
+        renderer.shutdown()
+    assert pdf.startswith(b"%PDF")
+
+
+async def test_timeout_does_not_count_the_wait_for_a_worker(monkeypatch):
+    monkeypatch.setattr(server, "_render_invoice_pdf", slow_render)
+    renderer = server.PdfRenderer(workers=1, timeout=0.35, max_queue=4)
+    renderer._executor = ThreadPoolExecutor(max_workers=1)
+    invoice = server.Invoice(**make_invoice("i1", 0))
+
+    # The third render waits ~0.4s for the worker but renders in 0.2s
+    results = await asyncio.gather(*(renderer.render(invoice, {}, USER) for _ in range(3)))
+    renderer.shutdown()
+    assert results == [b"%PDF-slow"] * 3
+    assert renderer.timeouts == 0
+    stats = renderer.stats()
+    assert stats["queue_seconds"]["count"] == 3
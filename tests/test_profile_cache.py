@@ -0,0 +1,19 @@
+"""
+Shared user/profile cache
+"""
+
+import server
+
+
+async def test_missing_profile_is_not_cached(db):
+    await db.users.insert_one({"id": "user-1", "email": "marie@test.com"})
+    _, before = await server.load_user_and_profile("user-1")
+    assert before is None
+
+    # Onboarding handled by another worker: this process's cache is not invalidated
+    await db.profiles.insert_one({"user_id": "user-1", "vat_regime": "franchise"})
+    _, after = await server.load_user_and_profile("user-1")
+    _, cached = await server.load_user_and_profile("user-1")
+    assert after["vat_regime"] == "franchise"
+    assert cached["vat_regime"] == "franchise"
+    assert server.profile_cache.hits == 1
@@ -0,0 +1,76 @@
+"""
+Recurring invoice scheduler
+"""
+
+from datetime import datetime
+
+import server
+
+
+def make_template(start_date: datetime) -> server.RecurringInvoice:
+    return server.RecurringInvoice(
+        user_id="user-1",
+        client_name="Entreprise XYZ",
+        client_email="contact@xyz.fr",
+        client_address="1 rue de Paris",
+        amount_ht=1000.0,
+        description="Abonnement",
+        cadence="monthly",
+        start_date=start_date,
+        next_run_date=start_date,
+    )
+
+
+async def test_month_end_template_keeps_its_day(db):
+    template = make_template(datetime(2025, 1, 31))
+    await db.profiles.insert_one({"user_id": "user-1", "vat_regime": "franchise"})
+    await db.recurring_invoices.insert_one(template.model_dump())
+
+    assert await server.run_recurring_invoices(now=datetime(2025, 4, 1)) == 3
+    assert await server.run_recurring_invoices(now=datetime(2025, 6, 1)) == 2
+    invoices = await db.invoices.find({}, {"_id": 0, "created_at": 1}).sort("created_at", 1).to_list(10)
+    assert [invoice["created_at"].strftime("%m-%d") for invoice in invoices] == ["01-31", "02-28", "03-31", "04-30", "05-31"]
+    stored = await db.recurring_invoices.find_one({"id": template.id})
+    assert stored["occurrence_count"] == 5
+    assert stored["next_run_date"] == datetime(2025, 6, 30)
+
+
+async def test_number_collision_renumbers_instead_of_skipping(db):
+    template = make_template(datetime(2025, 1, 31))
+    await server.ensure_indexes()
+    await db.profiles.insert_one({"user_id": "user-1", "vat_regime": "franchise"})
+    await db.recurring_invoices.insert_one(template.model_dump())
+    # Stale counter: numbers 1 and 2 were issued without it
+    await db.invoice_counters.insert_one({"_id": "user-1:2025", "user_id": "user-1", "year": 2025, "seq": 0})
+    await db.invoices.insert_many([
+        {"id": "legacy-1", "user_id": "user-1", "invoice_number": "FAC-2025-0001"},
+        {"id": "legacy-2", "user_id": "user-1", "invoice_number": "FAC-2025-0002"},
+    ])
+
+    assert await server.run_recurring_invoices(now=datetime(2025, 4, 1)) == 3
+    numbers = await db.invoices.find({"id": {"$regex": "^rec-"}}, {"_id": 0, "invoice_number": 1}).to_list(10)
+    assert sorted(n["invoice_number"] for n in numbers) == ["FAC-2025-0003", "FAC-2025-0004", "FAC-2025-0005"]
+    assert (await db.recurring_invoices.find_one({"id": template.id}))["occurrence_count"] == 3
+
+
+async def test_interrupted_pass_is_not_duplicated(db):
+    template = make_template(datetime(2025, 1, 31))
+    await server.ensure_indexes()
+    await db.profiles.insert_one({"user_id": "user-1", "vat_regime": "franchise"})
+    await db.recurring_invoices.insert_one(template.model_dump())
+    # The January invoice was written but the template was not advanced
+    await db.invoices.insert_one({"id": f"rec-{template.id}-20250131", "user_id": "user-1", "invoice_number": "FAC-2025-0001"})
+
+    assert await server.run_recurring_invoices(now=datetime(2025, 2, 1)) == 0
+    assert await db.invoices.count_documents({}) == 1
+    assert (await db.recurring_invoices.find_one({"id": template.id}))["occurrence_count"] == 1
+
+
+async def test_catch_up_across_years_uses_each_run_year(db):
+    template = make_template(datetime(2024, 12, 15))
+    await db.profiles.insert_one({"user_id": "user-1", "vat_regime": "franchise"})
+    await db.recurring_invoices.insert_one(template.model_dump())
+
+    assert await server.run_recurring_invoices(now=datetime(2025, 2, 20)) == 3
+    invoices = await db.invoices.find({}, {"_id": 0, "invoice_number": 1, "created_at": 1}).sort("created_at", 1).to_list(10)
+    assert [invoice["invoice_number"] for invoice in invoices] == ["FAC-2024-0001", "FAC-2025-0001", "FAC-2025-0002"]
@@ -0,0 +1,36 @@
+"""
+Batch reminders: one bulk write path, per-invoice results
+"""
+
+import server
+from tests.test_invoices import INVOICE
+
+
+async def create_invoice(api, auth) -> str:
+    response = await api.post("/api/invoices", json={**INVOICE, "amount_ht": 100.0}, headers=auth)
+    return response.json()["id"]
+
+
+async def test_batch_reports_each_invoice(api, auth, db):
+    await server.ensure_indexes()
+    sent, paid, already_sending = [await create_invoice(api, auth) for _ in range(3)]
+    await api.put(f"/api/invoices/{paid}/status", params={"status": "paid"}, headers=auth)
+    # A concurrent send already inserted this invoice's first reminder
+    await db.reminders.insert_one({"id": f"{already_sending}-1", "invoice_id": already_sending})
+
+    response = await api.post("/api/invoices/reminders:batch", json={
+        "invoice_ids": [sent, "unknown", paid, already_sending, sent],
+    }, headers=auth)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(r["invoice_id"], r["status"]) for r in results] == [
+        (sent, "sent"), ("unknown", "error"), (paid, "error"), (already_sending, "error"),
+    ]
+    assert [r.get("detail") for r in results[1:]] == [
+        "Facture non trouvée", "Cette facture est déjà payée", "Une relance est déjà en cours d'envoi pour cette facture",
+    ]
+    assert response.json()["message"] == "1 relance(s) envoyée(s)"
+    assert (await db.invoices.find_one({"id": sent}))["reminder_count"] == 1
+    assert await db.reminders.count_documents({"invoice_id": sent}) == 1
+    assert await db.outbox.count_documents({"id": f"reminder-{sent}-1"}) == 1
@@ -0,0 +1,46 @@
+"""
+Slow request profiles and the admin routes that expose them
+"""
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def profile_store(monkeypatch, tmp_path):
+    store = server.ProfileStore(tmp_path / "profiles", max_reports=3)
+    monkeypatch.setattr(server, "profile_store", store)
+    monkeypatch.setattr(server, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(server, "PROFILING_LATENCY_BUDGET_MS", 0.0)  # Every request is "slow"
+    monkeypatch.setattr(server, "PROFILING_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "admin-secret")
+    return store
+
+
+async def test_slow_requests_are_stored_and_rotated(api, auth, profile_store):
+    for _ in range(4):
+        await api.get("/api/notifications", headers=auth)
+
+    reports = profile_store.list()
+    assert len(reports) == 3
+    report = profile_store.get(reports[0]["id"])
+    assert (report["method"], report["route"], report["status"]) == ("GET", "/api/notifications", 200)
+    assert report["sampled"] is False
+
+
+async def test_profiles_are_admin_only(api, auth, profile_store):
+    profile_store.max_reports = 10
+    await api.get("/api/notifications", headers=auth)
+
+    assert (await api.get("/api/admin/profiles", headers=auth)).status_code == 403
+    wrong = {**auth, "X-Admin-Token": "guess"}
+    assert (await api.get("/api/admin/profiles", headers=wrong)).status_code == 403
+
+    admin = {**auth, "X-Admin-Token": "admin-secret"}
+    listed = (await api.get("/api/admin/profiles", headers=admin)).json()
+    assert sorted(r["route"] for r in listed) == ["/api/admin/profiles"] * 2 + ["/api/notifications"]
+    report_id = next(r["id"] for r in listed if r["route"] == "/api/notifications")
+    report = await api.get(f"/api/admin/profiles/{report_id}", headers=admin)
+    assert report.json()["path"] == "/api/notifications"
+    assert (await api.get("/api/admin/profiles/..%2F..%2Fserver", headers=admin)).status_code == 404
@@ -0,0 +1,30 @@
+"""
+SMTP connection pool shared by the outbox sender threads
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+
+
+class FakeConnection:
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        pass
+
+
+def test_pool_is_safe_across_threads(monkeypatch):
+    pool = server.SmtpConnectionPool(4)
+    monkeypatch.setattr(pool, "_connect", FakeConnection)
+
+    def use_pool(_):
+        for _ in range(500):
+            pool.release(pool.acquire())
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(use_pool, range(8)))
+    assert len(pool._idle) <= pool.size
+    pool.close()
+    assert pool._idle == []
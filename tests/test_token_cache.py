@@ -0,0 +1,54 @@
+"""
+Verified token cache in front of verify_token
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+import server
+
+
+def make_token(user_id: str = "user-1", expires_in: timedelta = timedelta(days=1)) -> str:
+    return jwt.encode({"user_id": user_id, "exp": datetime.utcnow() + expires_in}, server.JWT_SECRET, algorithm=server.JWT_ALGORITHM)
+
+
+@pytest.fixture
+def token_cache(monkeypatch):
+    cache = server.TokenCache(max_size=2, ttl=300)
+    monkeypatch.setattr(server, "token_cache", cache)
+    return cache
+
+
+async def test_repeat_requests_skip_decoding(api, token_cache, monkeypatch):
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    assert (await api.get("/api/notifications/unread-count", headers=headers)).status_code == 200
+
+    def no_decode(*args, **kwargs):
+        raise AssertionError("decoded again")
+
+    monkeypatch.setattr(server.jwt, "decode", no_decode)
+    assert (await api.get("/api/notifications/unread-count", headers=headers)).status_code == 200
+    assert (token_cache.hits, token_cache.misses) == (1, 1)
+
+
+async def test_bad_tokens_are_rejected_and_not_cached(api, token_cache):
+    expired = {"Authorization": f"Bearer {make_token(expires_in=timedelta(seconds=-1))}"}
+    forged = {"Authorization": f"Bearer {make_token()[:-4]}abcd"}
+
+    for _ in range(2):
+        assert (await api.get("/api/notifications/unread-count", headers=expired)).json()["detail"] == "Token expiré"
+        assert (await api.get("/api/notifications/unread-count", headers=forged)).json()["detail"] == "Token invalide"
+    assert token_cache.stats()["size"] == 0
+
+
+def test_entries_end_at_token_expiry_and_are_bounded(token_cache):
+    token_cache.put("short", {"user_id": "user-1", "exp": time.time() - 1})
+    assert token_cache.get("short") is None
+
+    for token in ("a", "b", "c"):
+        token_cache.put(token, {"user_id": token})
+    assert token_cache.get("a") is None
+    assert token_cache.get("c") == {"user_id": "c"}